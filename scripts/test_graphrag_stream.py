@@ -1,8 +1,51 @@
 import asyncio
-import json
 import sys
+import time
 
 import httpx
+import orjson
+
+
+# 进程内共用一个客户端：keep-alive 复用连接，https 下经 ALPN 走 HTTP/2 多路复用
+_client: httpx.AsyncClient | None = None
+_client_lock = asyncio.Lock()
+
+
+async def get_client() -> httpx.AsyncClient:
+    global _client
+    async with _client_lock:
+        if _client is None:
+            _client = httpx.AsyncClient(
+                timeout=None,
+                transport=httpx.AsyncHTTPTransport(
+                    http2=True,
+                    retries=1,
+                    limits=httpx.Limits(max_connections=10, max_keepalive_connections=10),
+                ),
+            )
+    return _client
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def iter_lines(resp: httpx.Response, chunk_size: int = 65536):
+    """
+    以 64KB 大块读取字节流，自己按 \n 切行（比 aiter_lines 的小块读取省 CPU）。
+    """
+    buf = bytearray()
+    async for chunk in resp.aiter_bytes(chunk_size):
+        buf += chunk
+        while (i := buf.find(b"\n")) != -1:
+            line = bytes(buf[:i]).rstrip(b"\r")
+            del buf[: i + 1]
+            yield line
+    if buf:
+        yield bytes(buf).rstrip(b"\r")
 
 
 async def main() -> None:
@@ -25,41 +68,69 @@ async def main() -> None:
 
     event_type = None
 
-    async with httpx.AsyncClient(timeout=None) as client:
-        async with client.stream("POST", url, json=payload) as resp:
-            resp.raise_for_status()
-
-            async for line in resp.aiter_lines():
-                if not line:
-                    continue
-
-                if line.startswith("event:"):
-                    event_type = line[len("event:"):].strip()
-                    continue
-
-                if line.startswith("data:"):
-                    data_str = line[len("data:"):].strip()
-                    try:
-                        data = json.loads(data_str)
-                    except Exception:
-                        data = data_str
-
-                    if event_type == "meta":
-                        print("[meta]", json.dumps(data, ensure_ascii=False))
-
-                    elif event_type == "token":
-                        # 你的后端是 {"id":..., "delta":"..."}
-                        if isinstance(data, dict):
-                            delta = data.get("delta")
-                            if delta:
-                                print(delta, end="", flush=True)
+    # token 直接以 UTF-8 写 stdout.buffer，攒够 4KB 或 50ms 再 flush 一次
+    out = sys.stdout.buffer
+    out_buf = bytearray()
+    last_flush = time.monotonic()
+
+    def flush_tokens() -> None:
+        nonlocal last_flush
+        if out_buf:
+            # 先把文本层里 print 的内容刷出去，否则管道输出时 [request]/[meta] 会排到 token 后面
+            sys.stdout.flush()
+            out.write(out_buf)
+            out.flush()
+            out_buf.clear()
+        last_flush = time.monotonic()
+
+    client = await get_client()
+    async with client.stream("POST", url, json=payload) as resp:
+        resp.raise_for_status()
+
+        async for line in iter_lines(resp):
+            if not line:
+                continue
+
+            if line[:6] == b"event:":
+                event_type = line[6:].strip().decode("utf-8")
+                continue
+
+            if line[:5] == b"data:":
+                data_raw = line[5:].strip()
+                # 先看首字节，只有 JSON 对象/数组才交给 orjson
+                if data_raw[:1] in (b"{", b"["):
+                    data = orjson.loads(data_raw)
+                else:
+                    data = data_raw.decode("utf-8")
+
+                if event_type == "meta":
+                    flush_tokens()
+                    print("[meta]", orjson.dumps(data).decode())
+
+                elif event_type == "token":
+                    # 你的后端是 {"id":..., "delta":"..."}
+                    if isinstance(data, dict):
+                        delta = data.get("delta")
+                        if delta:
+                            out_buf += delta.encode("utf-8")
+                            if len(out_buf) >= 4096 or time.monotonic() - last_flush > 0.05:
+                                flush_tokens()
+
+                elif event_type == "done":
+                    flush_tokens()
+                    print("\n\n[done]", orjson.dumps(data).decode())
+                    return
+
+    flush_tokens()
+    print("\n[stream] ended without done event")
 
-                    elif event_type == "done":
-                        print("\n\n[done]", json.dumps(data, ensure_ascii=False))
-                        return
 
-    print("\n[stream] ended without done event")
+async def _run() -> None:
+    try:
+        await main()
+    finally:
+        await close_client()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    asyncio.run(_run())
@@ -16,6 +16,9 @@ from .auth_store import (
     store_refresh_jti,
     is_refresh_jti_valid,
     revoke_refresh_jti,
+    get_user_view,
+    invalidate_user_cache,
+    user_view_from_claims,
 )
 from .jwt_utils import create_access_token, create_refresh_token, decode_token
 
@@ -96,7 +99,7 @@ async def login(req: LoginRequest, resp: Response, db: AsyncSession = Depends(ge
     if not user.is_verified:
         raise HTTPException(status_code=403, detail="Email not verified")
 
-    access = create_access_token(user.id)
+    access = create_access_token(user)
     refresh, jti, refresh_exp = create_refresh_token(user.id)
     await store_refresh_jti(db, user_id=user.id, jti=jti, expires_at=refresh_exp)
 
@@ -131,8 +134,8 @@ async def refresh(request: Request, resp: Response, db: AsyncSession = Depends(g
         raise HTTPException(status_code=401, detail="Missing refresh token")
 
     try:
-        payload = decode_token(refresh_token)
-    except Exception:
+        payload = decode_token(refresh_token, require_jti=True)
+    except ValueError:
         raise HTTPException(status_code=401, detail="Invalid refresh token")
 
     if payload.get("type") != "refresh":
@@ -146,10 +149,15 @@ async def refresh(request: Request, resp: Response, db: AsyncSession = Depends(g
     if not await is_refresh_jti_valid(db, jti):
         raise HTTPException(status_code=401, detail="Refresh token revoked or expired")
 
-    # 轮换：撤销旧 refresh，发新 refresh
-    await revoke_refresh_jti(db, jti)
+    # 轮换：撤销旧 refresh，发新 refresh；撤销失败说明已被用过/撤销过
+    if not await revoke_refresh_jti(db, jti):
+        raise HTTPException(status_code=401, detail="Refresh token revoked or expired")
+
+    user = await get_user_view(db, user_id)
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
 
-    access = create_access_token(user_id)
+    access = create_access_token(user)
     new_refresh, new_jti, new_exp = create_refresh_token(user_id)
     await store_refresh_jti(db, user_id=user_id, jti=new_jti, expires_at=new_exp)
 
@@ -172,11 +180,12 @@ async def logout(request: Request, resp: Response, db: AsyncSession = Depends(ge
     refresh_token = request.cookies.get(settings.REFRESH_COOKIE_NAME, "")
     if refresh_token:
         try:
-            payload = decode_token(refresh_token)
-            if payload.get("type") == "refresh" and payload.get("jti"):
-                await revoke_refresh_jti(db, payload["jti"])
-        except Exception:
-            pass
+            payload = decode_token(refresh_token, require_jti=True)
+        except ValueError:
+            payload = None
+        if payload and payload.get("type") == "refresh":
+            await revoke_refresh_jti(db, payload["jti"])
+            invalidate_user_cache(payload["sub"])
 
     resp.delete_cookie(settings.ACCESS_COOKIE_NAME, path="/")
     resp.delete_cookie(settings.REFRESH_COOKIE_NAME, path="/")
@@ -190,7 +199,7 @@ async def me(request: Request, db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=401, detail="Not logged in")
     try:
         payload = decode_token(access)
-    except Exception:
+    except ValueError:
         raise HTTPException(status_code=401, detail="Invalid token")
     if payload.get("type") != "access":
         raise HTTPException(status_code=401, detail="Invalid token type")
@@ -199,15 +208,8 @@ async def me(request: Request, db: AsyncSession = Depends(get_db)):
     if not user_id:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    from .auth_store import get_user_by_id
-    user = await get_user_by_id(db, user_id)
+    user = user_view_from_claims(payload) or await get_user_view(db, user_id)
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
 
-    return {
-        "id": user.id,
-        "email": user.email,
-        "nickname": user.nickname,
-        "avatar_url": user.avatar_url,
-        "is_verified": user.is_verified,
-    }
+    return user._asdict()
@@ -5,7 +5,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from .db import SessionLocal
 from .jwt_utils import decode_token
-from .auth_store import get_user_by_id
+from .auth_store import get_user_view, user_view_from_claims
 from .settings import settings
 
 
@@ -31,7 +31,7 @@ async def get_current_user(
 
     try:
         payload = decode_token(token)
-    except Exception:
+    except ValueError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
     if payload.get("type") != "access":
@@ -41,7 +41,7 @@ async def get_current_user(
     if not user_id:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    user = await get_user_by_id(db, user_id)
+    user = user_view_from_claims(payload) or await get_user_view(db, user_id)
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
 
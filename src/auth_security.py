@@ -2,22 +2,34 @@ from __future__ import annotations
 
 import hashlib
 import secrets
-from passlib.context import CryptContext
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
 
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+# 直接用 argon2-cffi；passlib 生成的 $argon2id$ 哈希格式相同，可直接校验
+_ph = PasswordHasher()
 
 
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    return _ph.hash(password)
 
 
 def verify_password(password: str, password_hash: str) -> bool:
-    return pwd_context.verify(password, password_hash)
+    try:
+        return _ph.verify(password_hash, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+
+def needs_rehash(password_hash: str) -> bool:
+    return _ph.check_needs_rehash(password_hash)
 
 
 def new_urlsafe_token(nbytes: int = 32) -> str:
     return secrets.token_urlsafe(nbytes)
 
 
-def sha256_hex(s: str) -> str:
-    return hashlib.sha256(s.encode("utf-8")).hexdigest()
+def token_digest(s: str) -> bytes:
+    """
+    token / jti 的索引哈希：BLAKE2b-160，20 字节原始摘要（直接存 BLOB，不转 hex）。
+    """
+    return hashlib.blake2b(s.encode("utf-8"), digest_size=20).digest()
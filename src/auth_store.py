@@ -1,13 +1,41 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import hmac
 from datetime import datetime, timedelta, timezone
+from typing import NamedTuple
 from uuid import uuid4
 
-from sqlalchemy import select, update
+from sqlalchemy import lambda_stmt, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from .auth_security import hash_password, verify_password, new_urlsafe_token, sha256_hex
+from .auth_security import hash_password, needs_rehash, verify_password, new_urlsafe_token, token_digest
+from .bloom import BloomFilter
+from .cache import TTLCache
 from .models import User, EmailVerificationToken, RefreshToken
+from .settings import settings
+
+
+class UserView(NamedTuple):
+    """
+    只读的用户视图：鉴权热路径只需要这些字段，不必持有 ORM 对象。
+    """
+    id: str
+    email: str
+    nickname: str
+    avatar_url: str | None
+    is_verified: bool
+
+
+# sub -> UserView；TTL 不超过 access token 有效期
+_user_cache = TTLCache(maxsize=10_000, ttl=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
+# HMAC(email:password:hash) -> user_id；短 TTL，只用来让连续重复登录跳过 Argon2
+_login_cache = TTLCache(maxsize=10_000, ttl=60)
+
+# 已撤销 refresh jti_hash 的 Bloom 过滤器：未命中即可判定“未撤销”，免一次 SELECT
+_revoked_jtis = BloomFilter(settings.REVOKED_BLOOM_CAPACITY, settings.REVOKED_BLOOM_ERROR_RATE)
 
 
 def _uuid() -> str:
@@ -34,15 +62,59 @@ def _as_utc_aware(dt: datetime) -> datetime:
 
 
 async def get_user_by_email(session: AsyncSession, email: str) -> User | None:
-    q = select(User).where(User.email == email.lower().strip())
+    email = email.lower().strip()
+    q = lambda_stmt(lambda: select(User).where(User.email == email))
     res = await session.execute(q)
     return res.scalar_one_or_none()
 
 
 async def get_user_by_id(session: AsyncSession, user_id: str) -> User | None:
-    q = select(User).where(User.id == user_id)
-    res = await session.execute(q)
-    return res.scalar_one_or_none()
+    # 主键查询走 identity map，命中时不发 SQL
+    return await session.get(User, user_id)
+
+
+def _user_view(user: User) -> UserView:
+    return UserView(
+        id=user.id,
+        email=user.email,
+        nickname=user.nickname,
+        avatar_url=user.avatar_url,
+        is_verified=user.is_verified,
+    )
+
+
+async def get_user_view(session: AsyncSession, user_id: str) -> UserView | None:
+    """
+    先查进程内缓存，未命中再查库并回填。
+    """
+    view = _user_cache.get(user_id)
+    if view is not None:
+        return view
+    user = await get_user_by_id(session, user_id)
+    if not user:
+        return None
+    view = _user_view(user)
+    _user_cache.set(user_id, view)
+    return view
+
+
+def user_view_from_claims(payload: dict) -> UserView | None:
+    """
+    由 access token 的 claims 还原用户；旧 token 缺字段时返回 None，由调用方回退查库。
+    """
+    if "email" not in payload or "ver" not in payload:
+        return None
+    return UserView(
+        id=payload["sub"],
+        email=payload["email"],
+        nickname=payload.get("nick") or "",
+        avatar_url=payload.get("avatar"),
+        is_verified=bool(payload["ver"]),
+    )
+
+
+def invalidate_user_cache(user_id: str) -> None:
+    _user_cache.pop(user_id)
 
 
 async def create_user(
@@ -57,7 +129,7 @@ async def create_user(
     user = User(
         id=_uuid(),
         email=email.lower().strip(),
-        password_hash=hash_password(password),
+        password_hash=await asyncio.to_thread(hash_password, password),
         is_verified=False,
         nickname=nickname_val,
         avatar_url=avatar_val,
@@ -72,8 +144,27 @@ async def authenticate_user(session: AsyncSession, email: str, password: str) ->
     user = await get_user_by_email(session, email)
     if not user:
         return None
-    if not verify_password(password, user.password_hash):
+
+    # key 里带上 password_hash：改密码后旧缓存自然失效
+    key = hmac.new(
+        settings.JWT_SECRET_KEY.encode("utf-8"),
+        f"{user.email}:{password}:{user.password_hash}".encode("utf-8"),
+        hashlib.sha256,
+    ).digest()
+    if _login_cache.get(key) == user.id:
+        return user
+
+    # Argon2 很慢且吃内存，放线程池里跑，别阻塞事件循环
+    if not await asyncio.to_thread(verify_password, password, user.password_hash):
         return None
+
+    # 参数变更后的旧哈希：登录成功时顺手重算（lazy migrate）
+    if needs_rehash(user.password_hash):
+        user.password_hash = await asyncio.to_thread(hash_password, password)
+        await session.commit()
+        return user
+
+    _login_cache.set(key, user.id)
     return user
 
 
@@ -82,7 +173,7 @@ async def create_email_verification(session: AsyncSession, user_id: str) -> str:
     rec = EmailVerificationToken(
         id=_uuid(),
         user_id=user_id,
-        token_hash=sha256_hex(raw),
+        token_hash=token_digest(raw),
         expires_at=_now() + timedelta(hours=24),
         used_at=None,
         created_at=_now(),
@@ -93,38 +184,43 @@ async def create_email_verification(session: AsyncSession, user_id: str) -> str:
 
 
 async def verify_email_token(session: AsyncSession, raw_token: str) -> User | None:
-    h = sha256_hex(raw_token)
-    q = select(EmailVerificationToken).where(EmailVerificationToken.token_hash == h)
-    res = await session.execute(q)
-    rec = res.scalar_one_or_none()
-    if not rec:
-        return None
-
-    if rec.used_at is not None:
-        return None
-
-    # ✅ 修复：naive/aware datetime compare
-    if _as_utc_aware(rec.expires_at) < _now():
-        return None
-
-    await session.execute(
+    """
+    两条 UPDATE ... RETURNING 完成校验 + 置位：
+    - 第一条原子地“占用”token（未使用且未过期才会命中），顺带拿到 user_id
+    - 第二条置 is_verified 并直接返回用户行
+    SQLite 不支持 data-modifying CTE，无法合成一条；需要 SQLite >= 3.35。
+    """
+    h = token_digest(raw_token)
+    now = _now()
+    res = await session.execute(
         update(EmailVerificationToken)
-        .where(EmailVerificationToken.id == rec.id)
-        .values(used_at=_now())
+        .where(
+            EmailVerificationToken.token_hash == h,
+            EmailVerificationToken.used_at.is_(None),
+            EmailVerificationToken.expires_at > now,
+        )
+        .values(used_at=now)
+        .returning(EmailVerificationToken.user_id)
     )
-    await session.execute(
-        update(User).where(User.id == rec.user_id).values(is_verified=True)
+    user_id = res.scalar_one_or_none()
+    if not user_id:
+        await session.rollback()
+        return None
+
+    res = await session.execute(
+        update(User).where(User.id == user_id).values(is_verified=True).returning(User)
     )
+    user = res.scalar_one_or_none()
     await session.commit()
-
-    return await get_user_by_id(session, rec.user_id)
+    invalidate_user_cache(user_id)
+    return user
 
 
 async def store_refresh_jti(session: AsyncSession, user_id: str, jti: str, expires_at: datetime) -> None:
     rec = RefreshToken(
         id=_uuid(),
         user_id=user_id,
-        jti_hash=sha256_hex(jti),
+        jti_hash=token_digest(jti),
         expires_at=expires_at,
         revoked_at=None,
         created_at=_now(),
@@ -133,8 +229,30 @@ async def store_refresh_jti(session: AsyncSession, user_id: str, jti: str, expir
     await session.commit()
 
 
+async def load_revoked_jtis(session: AsyncSession) -> int:
+    """
+    启动时把未过期的已撤销 jti_hash 装进 Bloom 过滤器，返回装载数量。
+    """
+    q = select(RefreshToken.jti_hash).where(
+        RefreshToken.revoked_at.is_not(None),
+        RefreshToken.expires_at > _now(),
+    )
+    n = 0
+    for h in (await session.execute(q)).scalars():
+        _revoked_jtis.add(h)
+        n += 1
+    return n
+
+
 async def is_refresh_jti_valid(session: AsyncSession, jti: str) -> bool:
-    h = sha256_hex(jti)
+    """
+    过期由 JWT 的 exp 保证；这里只判断是否被撤销。
+    Bloom 未命中 -> 一定没撤销，直接放行；命中再查库排除假阳性。
+    """
+    h = token_digest(jti)
+    if h not in _revoked_jtis:
+        return True
+
     q = select(RefreshToken).where(RefreshToken.jti_hash == h)
     res = await session.execute(q)
     rec = res.scalar_one_or_none()
@@ -150,15 +268,17 @@ async def is_refresh_jti_valid(session: AsyncSession, jti: str) -> bool:
     return True
 
 
-async def revoke_refresh_jti(session: AsyncSession, jti: str) -> None:
-    h = sha256_hex(jti)
-    q = select(RefreshToken).where(RefreshToken.jti_hash == h)
-    res = await session.execute(q)
-    rec = res.scalar_one_or_none()
-    if not rec:
-        return
-
-    await session.execute(
-        update(RefreshToken).where(RefreshToken.id == rec.id).values(revoked_at=_now())
+async def revoke_refresh_jti(session: AsyncSession, jti: str) -> bool:
+    """
+    条件 UPDATE 一步完成撤销：只有原本未撤销的记录才会被更新。
+    返回 False 表示记录不存在或已被撤销（多 worker 时 Bloom 不共享，轮换以此为准）。
+    """
+    h = token_digest(jti)
+    res = await session.execute(
+        update(RefreshToken)
+        .where(RefreshToken.jti_hash == h, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=_now())
     )
     await session.commit()
+    _revoked_jtis.add(h)
+    return res.rowcount > 0
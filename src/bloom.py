@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+import hashlib
+import math
+
+
+class BloomFilter:
+    """
+    简单的 Bloom 过滤器（bytearray 位图 + 双重哈希）。
+    - 只会假阳性，不会假阴性：判定“不在”时一定不在
+    - 不支持删除；过期项靠进程重启时重新装载来淘汰
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 1e-6):
+        m = math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        self.num_bits = max(8, m)
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, key: str | bytes):
+        if isinstance(key, str):
+            key = key.encode("utf-8")
+        d = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(d[:8], "little")
+        h2 = int.from_bytes(d[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, key: str | bytes) -> None:
+        for pos in self._positions(key):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: str | bytes) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
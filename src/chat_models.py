@@ -1,50 +0,0 @@
-from __future__ import annotations
-
-from datetime import datetime, timezone
-from typing import List
-
-from sqlalchemy import DateTime, ForeignKey, String, Text
-from sqlalchemy.orm import Mapped, mapped_column, relationship
-
-from .db import Base
-
-
-def utcnow():
-    return datetime.now(timezone.utc)
-
-
-class Conversation(Base):
-    __tablename__ = "conversations"
-
-    id: Mapped[str] = mapped_column(String(32), primary_key=True)
-    user_id: Mapped[str] = mapped_column(String(32), index=True, nullable=False)
-
-    title: Mapped[str] = mapped_column(String(200), nullable=False, default="New chat")
-
-    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow, nullable=False)
-    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow, nullable=False)
-
-    messages: Mapped[List["ChatMessage"]] = relationship(
-        back_populates="conversation",
-        cascade="all, delete-orphan",
-        lazy="selectin",
-    )
-
-
-class ChatMessage(Base):
-    __tablename__ = "messages"
-
-    id: Mapped[str] = mapped_column(String(32), primary_key=True)
-    conversation_id: Mapped[str] = mapped_column(
-        String(32),
-        ForeignKey("conversations.id", ondelete="CASCADE"),
-        index=True,
-        nullable=False,
-    )
-
-    role: Mapped[str] = mapped_column(String(20), nullable=False)  # user / assistant / system / meta
-    content: Mapped[str] = mapped_column(Text, nullable=False)
-
-    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow, nullable=False)
-
-    conversation: Mapped["Conversation"] = relationship(back_populates="messages")
@@ -1,11 +1,10 @@
 from __future__ import annotations
 
-import json
 from datetime import datetime, timezone
 from typing import Any
 from uuid import uuid4
 
-from sqlalchemy import desc, func, select, update
+from sqlalchemy import desc, func, insert, lambda_stmt, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from .models import Conversation, Message
@@ -37,8 +36,8 @@ async def create_conversation(
 async def list_conversations(
     session: AsyncSession, user_id: str, limit: int = 50
 ) -> list[Conversation]:
-    q = (
-        select(Conversation)
+    q = lambda_stmt(
+        lambda: select(Conversation)
         .where(Conversation.user_id == user_id)
         .order_by(desc(Conversation.updated_at))
         .limit(limit)
@@ -50,50 +49,48 @@ async def list_conversations(
 async def get_conversation(
     session: AsyncSession, user_id: str, conversation_id: str
 ) -> Conversation | None:
-    q = select(Conversation).where(
-        Conversation.id == conversation_id, Conversation.user_id == user_id
+    q = lambda_stmt(
+        lambda: select(Conversation).where(
+            Conversation.id == conversation_id, Conversation.user_id == user_id
+        )
     )
     res = await session.execute(q)
     return res.scalar_one_or_none()
 
 
-async def touch_conversation(session: AsyncSession, conversation_id: str) -> None:
-    await session.execute(
-        update(Conversation)
-        .where(Conversation.id == conversation_id)
-        .values(updated_at=_now())
-    )
-    await session.commit()
-
-
 async def add_message(
     session: AsyncSession,
     conversation_id: str,
     role: str,
     content: str,
     meta: dict[str, Any] | None = None,
+    commit: bool = True,
 ) -> Message:
     """
     写入消息，并同步更新 Conversation.updated_at（同一次 commit）。
+    不要再单独 touch 会话：INSERT 与 UPDATE 必须落在同一个事务里。
+    commit=False 时由调用方与其他写操作一起提交。
+    走 Core INSERT，不进 unit of work（不做 flush / identity map 登记）；返回的 Message 不挂在 session 上。
     """
-    msg = Message(
-        id=_uuid(),
-        conversation_id=conversation_id,
-        role=role,
-        content=content,
-        created_at=_now(),
-        meta_json=json.dumps(meta or {}, ensure_ascii=False),
-    )
-    session.add(msg)
-
+    now = _now()
+    row = {
+        "id": _uuid(),
+        "conversation_id": conversation_id,
+        "role": role,
+        "content": content,
+        "created_at": now,
+        "meta_json": meta or {},
+    }
+    await session.execute(insert(Message).values(**row))
     await session.execute(
         update(Conversation)
         .where(Conversation.id == conversation_id)
-        .values(updated_at=_now())
+        .values(updated_at=now)
     )
 
-    await session.commit()
-    return msg
+    if commit:
+        await session.commit()
+    return Message(**row)
 
 
 async def list_messages(
@@ -102,8 +99,8 @@ async def list_messages(
     """
     返回时间正序 messages（用于前端展示）。
     """
-    q = (
-        select(Message)
+    q = lambda_stmt(
+        lambda: select(Message)
         .where(Message.conversation_id == conversation_id)
         .order_by(Message.created_at.asc())
         .limit(limit)
@@ -119,16 +116,15 @@ async def list_recent_messages_for_llm(
     给 LLM 用：最近 N 条（时间正序）
     """
     limit = max(1, min(limit, 100))
-    q = (
-        select(Message)
+    # 只取两列元组，不做 ORM 实体装配
+    q = lambda_stmt(
+        lambda: select(Message.role, Message.content)
         .where(Message.conversation_id == conversation_id)
         .order_by(desc(Message.created_at))
         .limit(limit)
     )
-    res = await session.execute(q)
-    rows = list(res.scalars().all())
-    rows.reverse()
-    return [{"role": m.role, "content": m.content} for m in rows]
+    rows = (await session.execute(q)).all()
+    return [{"role": role, "content": content} for role, content in reversed(rows)]
 
 
 async def get_message_count(session: AsyncSession, conversation_id: str) -> int:
@@ -143,6 +139,7 @@ async def update_conversation_title(
     user_id: str,
     conversation_id: str,
     title: str,
+    commit: bool = True,
 ) -> None:
     """
     仅更新归属于 user_id 的会话标题，避免越权写。
@@ -156,4 +153,5 @@ async def update_conversation_title(
         .where(Conversation.id == conversation_id, Conversation.user_id == user_id)
         .values(title=title, updated_at=_now())
     )
-    await session.commit()
+    if commit:
+        await session.commit()
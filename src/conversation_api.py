@@ -1,36 +1,36 @@
 from __future__ import annotations
 
 import asyncio
-import json
-import re
+import io
+import logging
 import uuid
 from typing import Any, AsyncGenerator
 
 from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import StreamingResponse
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
 
 from .auth_deps import get_current_user
+from .cache import TTLCache
 from .db import SessionLocal
+from .entity_batcher import entity_batcher
 from .chat_store import (
     add_message,
     create_conversation,
     get_conversation,
-    get_message_count,
     list_conversations,
     list_messages,
     list_recent_messages_for_llm,
     update_conversation_title,
 )
-from .graphrag_retriever import neo4j_retrieve, build_context
-from .llm_client import DeepSeekClient
-
-router = APIRouter(prefix="/conversations", tags=["Conversations"])
-llm = DeepSeekClient()
+from .graphrag_retriever import build_context, lexical_keywords, merge_retrieved, neo4j_retrieve
+from .llm_client import get_llm_client
+from .sse_utils import EV_DONE, EV_ERROR, EV_META, event_stream_response, sse, sse_token
 
+logger = logging.getLogger(__name__)
 
-def sse(event: str, data: Any) -> str:
-    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+router = APIRouter(prefix="/conversations", tags=["Conversations"])
+llm = get_llm_client()
 
 
 class CreateConversationRequest(BaseModel):
@@ -45,39 +45,45 @@ class ChatRequest(BaseModel):
     last_n_history: int = Field(default=20, ge=1, le=100)
 
 
+# 相同问句的实体抽取结果 / 标题结果缓存；进行中的抽取按问句合并
+_entity_cache = TTLCache(maxsize=4096, ttl=3600)
+_entity_inflight: dict[str, asyncio.Task] = {}
+_title_cache = TTLCache(maxsize=1024, ttl=3600)
+
+
 async def extract_entities(question: str) -> dict[str, Any]:
-    system = (
-        "你是信息抽取器。给定小说问句，抽取可能的实体与关键词。"
-        "只输出严格 JSON，不要输出多余文字。字段：persons, locations, orgs, events, keywords，值为字符串数组。"
-    )
-    resp = await llm.chat_completion_async(
-        messages=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": question},
-        ],
-        stream=False,
-        temperature=0.0,
-    )
-    content = (resp["choices"][0]["message"].get("content") or "").strip()
-    try:
-        data = json.loads(content)
-        return {
-            "persons": data.get("persons", []) or [],
-            "locations": data.get("locations", []) or [],
-            "orgs": data.get("orgs", []) or [],
-            "events": data.get("events", []) or [],
-            "keywords": data.get("keywords", []) or [],
-        }
-    except Exception:
+    """
+    先查缓存；同一问句并发进来时只发一次 LLM 请求，其余等待同一个 task。
+    解析失败的兜底结果不入缓存。
+    """
+    key = question.strip()
+    ent = _entity_cache.get(key)
+    if ent is not None:
+        return ent
+
+    task = _entity_inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(entity_batcher.extract(question))
+        _entity_inflight[key] = task
+        task.add_done_callback(lambda _t: _entity_inflight.pop(key, None))
+
+    # shield：某个请求被取消不影响其他等待同一结果的请求
+    ent = await asyncio.shield(task)
+    if ent is None:
         return {"persons": [], "locations": [], "orgs": [], "events": [], "keywords": [question]}
+    _entity_cache.set(key, ent)
+    return ent
+
+
+# 标题末尾要去掉的常见句尾标点/引号
+_TITLE_TAIL_CHARS = "。！？!?,，:：；;“”\"'()[]{}"
 
 
 def _clean_title(s: str) -> str:
     s = (s or "").strip()
     s = s.strip('"').strip("'").strip()
-    s = s.splitlines()[0].strip() if s else s
-    # 去掉常见句尾标点/引号
-    s = re.sub(r"[。！？!?,，:：；;“”\"'()\[\]{}]+$", "", s).strip()
+    s = s.partition("\n")[0].strip()
+    s = s.rstrip(_TITLE_TAIL_CHARS).strip()
     # 太长就截断
     if len(s) > 30:
         s = s[:30].strip()
@@ -104,6 +110,11 @@ async def generate_conversation_title(question: str, answer: str) -> str:
     )
     user = f"用户问题：{q}\n\n助手回答（摘要）：{a[:400]}"
 
+    cache_key = (q, a[:400])
+    cached = _title_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
     try:
         resp = await llm.chat_completion_async(
             messages=[
@@ -115,11 +126,51 @@ async def generate_conversation_title(question: str, answer: str) -> str:
         )
         raw = (resp["choices"][0]["message"].get("content") or "").strip()
         title = _clean_title(raw)
+        if title:
+            _title_cache.set(cache_key, title)
         return title or fallback
     except Exception:
         return fallback
 
 
+# 后台任务（自动标题）：持有引用防止被 GC，完成后自动移除；超过上限放弃并记一条警告
+_MAX_BACKGROUND_TASKS = 64
+_background_tasks: set[asyncio.Task] = set()
+
+
+def _spawn_background(coro) -> None:
+    if len(_background_tasks) >= _MAX_BACKGROUND_TASKS:
+        logger.warning(
+            "background task dropped: %d already pending (%s)",
+            len(_background_tasks), getattr(coro, "__qualname__", coro),
+        )
+        coro.close()
+        return
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def _title_and_update(user_id: str, conversation_id: str, question: str, answer: str) -> None:
+    """
+    先等 LLM 出标题，拿到结果后才开新会话写库。
+    """
+    try:
+        new_title = _clean_title(await generate_conversation_title(question, answer))
+        if not new_title or new_title == "New chat":
+            return
+        async with SessionLocal() as db:
+            await update_conversation_title(
+                db,
+                user_id=user_id,
+                conversation_id=conversation_id,
+                title=new_title,
+            )
+    except Exception:
+        # 没人 await 这个任务：在这里记下，不留到 GC 时才报 "exception was never retrieved"
+        logger.exception("auto title failed for conversation %s", conversation_id)
+
+
 @router.post("")
 async def create_conv(req: CreateConversationRequest, user=Depends(get_current_user)):
     async with SessionLocal() as db:
@@ -162,24 +213,28 @@ async def get_msgs(
             raise HTTPException(status_code=404, detail="Conversation not found")
 
         msgs = await list_messages(db, conversation_id, limit=limit)
-        return [
-            {
-                "id": m.id,
-                "role": m.role,
-                "content": m.content,
-                "created_at": m.created_at,
-                "meta": json.loads(m.meta_json or "{}"),
-            }
-            for m in msgs
-        ]
+        # meta 已由 JSON 列反序列化；直接交给 orjson 一次性编码，跳过 jsonable_encoder 逐行遍历
+        return ORJSONResponse(
+            [
+                {
+                    "id": m.id,
+                    "role": m.role,
+                    "content": m.content,
+                    "created_at": m.created_at,
+                    "meta": m.meta_json or {},
+                }
+                for m in msgs
+            ]
+        )
 
 
 @router.post("/{conversation_id}/chat")
 async def chat(conversation_id: str, req: ChatRequest, user=Depends(get_current_user)):
     req_id = str(uuid.uuid4())
 
-    # SSE 开始前：鉴权 + 写 user 消息 + 取历史（避免占用 DB 贯穿整个流式）
-    async with SessionLocal() as db:
+    # 整个请求只用一个 session：SSE 开始前鉴权 + 写 user 消息 + 取历史，流结束后写 assistant
+    db = SessionLocal()
+    try:
         conv = await get_conversation(db, user_id=user.id, conversation_id=conversation_id)
         if not conv:
             raise HTTPException(status_code=404, detail="Conversation not found")
@@ -192,29 +247,53 @@ async def chat(conversation_id: str, req: ChatRequest, user=Depends(get_current_
             meta={"request_id": req_id},
         )
 
+        # 至少取 2 条：顺带判断是否首轮（只有刚写入的这条 user），省一次 COUNT(*)
         history_msgs = await list_recent_messages_for_llm(
             db,
             conversation_id=conversation_id,
-            limit=req.last_n_history,
+            limit=max(2, req.last_n_history),
         )
-
-    async def event_gen() -> AsyncGenerator[str, None]:
+        is_first_turn = len(history_msgs) <= 1
+        history_msgs = history_msgs[-req.last_n_history:]
+        need_title = is_first_turn and (conv.title or "").strip() == "New chat"
+    finally:
+        # 归还连接但保留 session 对象：流式期间不占连接池
+        await db.close()
+
+    async def event_gen() -> AsyncGenerator[bytes, None]:
         ent: dict[str, Any] = {}
         retrieved: dict[str, Any] = {}
         chunk_ids: list[str] = []
-        answer_buf: list[str] = []
+        edges_count = 0
+        answer_buf = io.StringIO()
+
+        # 实体抽取（LLM）与基于原问句关键词的预检索并行，缩短首 token 时间
+        ent_task = asyncio.create_task(extract_entities(req.content))
+        pre_task = asyncio.create_task(
+            neo4j_retrieve(
+                {"keywords": lexical_keywords(req.content)},
+                top_k_chunks=req.top_k_chunks,
+                max_hops=req.max_hops,
+            )
+        )
 
         try:
-            # 1) 抽实体
-            ent = await extract_entities(req.content)
-            yield sse("meta", {"id": req_id, "stage": "entity_extracted", "entities": ent})
+            # 1) 抽实体：一返回就推 meta，不等检索
+            ent = await ent_task
+            yield sse(EV_META, {"id": req_id, "stage": "entity_extracted", "entities": ent})
 
-            # 2) Neo4j 检索
+            # 2) Neo4j 检索：实体检索为主，预检索结果补位
             retrieved = await neo4j_retrieve(ent, top_k_chunks=req.top_k_chunks, max_hops=req.max_hops)
-            chunk_ids = [c["chunk_id"] for c in retrieved.get("chunks", [])]
+            try:
+                pre_retrieved = await pre_task
+            except Exception:
+                pre_retrieved = {"edges": [], "chunks": []}
+            retrieved = merge_retrieved(retrieved, pre_retrieved, top_k_chunks=req.top_k_chunks)
+            chunk_ids = list(dict.fromkeys(c["chunk_id"] for c in retrieved.get("chunks", ())))
+            edges_count = len(retrieved.get("edges", ()))
             yield sse(
-                "meta",
-                {"id": req_id, "stage": "retrieved", "edges": len(retrieved.get("edges", [])), "chunks": chunk_ids},
+                EV_META,
+                {"id": req_id, "stage": "retrieved", "edges": edges_count, "chunks": chunk_ids},
             )
 
             # 3) 构造上下文 + 流式回答
@@ -232,56 +311,47 @@ async def chat(conversation_id: str, req: ChatRequest, user=Depends(get_current_
             ]
 
             async for token in llm.chat_completion_stream(messages=augmented, temperature=0.2):
-                answer_buf.append(token)
-                yield sse("token", {"id": req_id, "delta": token})
+                answer_buf.write(token)
+                yield sse_token(req_id, token)
 
-            yield sse("done", {"id": req_id, "stage": "completed"})
+            yield sse(EV_DONE, {"id": req_id, "stage": "completed"})
 
         except asyncio.CancelledError:
-            yield sse("error", {"id": req_id, "message": "client cancelled"})
+            yield sse(EV_ERROR, {"id": req_id, "message": "client cancelled"})
             raise
 
         except Exception as e:
-            yield sse("error", {"id": req_id, "message": str(e)})
+            yield sse(EV_ERROR, {"id": req_id, "message": str(e)})
             raise
 
         finally:
+            for t in (ent_task, pre_task):
+                if not t.done():
+                    t.cancel()
+
             # 流结束后：写 assistant + 自动标题（不影响前端拿到 done）
-            answer = "".join(answer_buf).strip()
+            answer = answer_buf.getvalue().strip()
             if not answer:
                 return
 
-            async with SessionLocal() as db2:
-                conv2 = await get_conversation(db2, user_id=user.id, conversation_id=conversation_id)
-                if not conv2:
-                    return
-
-                # 写 assistant
+            # 会话归属已在请求入口校验过，这里直接写 assistant，不再回查
+            try:
                 await add_message(
-                    db2,
+                    db,
                     conversation_id=conversation_id,
                     role="assistant",
                     content=answer,
                     meta={
                         "request_id": req_id,
                         "entities": ent,
-                        "retrieved": {"edges_count": len(retrieved.get("edges", [])) if retrieved else 0, "chunks": chunk_ids},
+                        "retrieved": {"edges_count": edges_count, "chunks": chunk_ids},
                     },
                 )
+            finally:
+                await db.close()
+
+            # ✅ 自动标题：仅在默认标题且首轮时生成；后台执行，不占当前会话与连接
+            if need_title:
+                _spawn_background(_title_and_update(user.id, conversation_id, req.content, answer))
 
-                # ✅ 自动标题：仅在默认标题且首轮（消息数<=2）时生成
-                if (conv2.title or "").strip() == "New chat":
-                    n = await get_message_count(db2, conversation_id=conversation_id)
-                    # 首轮通常就是：user + assistant = 2
-                    if n <= 2:
-                        new_title = await generate_conversation_title(req.content, answer)
-                        new_title = _clean_title(new_title)
-                        if new_title and new_title != "New chat":
-                            await update_conversation_title(
-                                db2,
-                                user_id=user.id,
-                                conversation_id=conversation_id,
-                                title=new_title,
-                            )
-
-    return StreamingResponse(event_gen(), media_type="text/event-stream")
+    return event_stream_response(event_gen())
@@ -1,27 +1,146 @@
 from __future__ import annotations
 
+import asyncio
+import logging
+import uuid
 from pathlib import Path
+from typing import Any
+
+import orjson
+from sqlalchemy import BINARY, CHAR, LargeBinary, event
+from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.types import TypeDecorator
 
 from .settings import settings
 
+logger = logging.getLogger(__name__)
+
 
 class Base(DeclarativeBase):
     pass
 
 
+class GUID(TypeDecorator):
+    """
+    UUID 主键/外键：库里存 16 字节（Postgres 用原生 UUID），Python 侧仍是 32 位 hex 字符串。
+    不是合法 hex 的参数（如 URL 里乱填的 id）按 NULL 绑定，查询自然不命中。
+    """
+
+    impl = CHAR(32)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(UUID(as_uuid=True))
+        if dialect.name == "sqlite":
+            return dialect.type_descriptor(LargeBinary(16))
+        return dialect.type_descriptor(BINARY(16))
+
+    def process_bind_param(self, value: Any, dialect) -> Any:
+        if value is None:
+            return None
+        try:
+            u = value if isinstance(value, uuid.UUID) else uuid.UUID(hex=value)
+        except (TypeError, ValueError):
+            return None
+        return u if dialect.name == "postgresql" else u.bytes
+
+    def process_result_value(self, value: Any, dialect) -> str | None:
+        if value is None:
+            return None
+        if isinstance(value, uuid.UUID):
+            return value.hex
+        if isinstance(value, str):
+            return value
+        return bytes(value).hex()
+
+
 def _sqlite_url() -> str:
     p = Path(settings.SQLITE_PATH)
     p.parent.mkdir(parents=True, exist_ok=True)
     return f"sqlite+aiosqlite:///{p.as_posix()}"
 
 
-engine = create_async_engine(_sqlite_url(), echo=settings.SQLITE_ECHO)
+engine = create_async_engine(
+    _sqlite_url(),
+    echo=settings.SQLITE_ECHO,
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_pre_ping=True,
+    pool_recycle=settings.DB_POOL_RECYCLE_S,
+    query_cache_size=1200,
+    # JSON 列走 orjson 编解码
+    json_serializer=lambda obj: orjson.dumps(obj).decode(),
+    json_deserializer=orjson.loads,
+)
+
+
+@event.listens_for(engine.sync_engine, "connect")
+def _sqlite_pragmas(dbapi_conn, _record) -> None:
+    # WAL：读写互不阻塞；synchronous=NORMAL：WAL 下只在 checkpoint 时 fsync
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.close()
+
+
 SessionLocal: async_sessionmaker[AsyncSession] = async_sessionmaker(bind=engine, expire_on_commit=False)
 
 
+def _create_missing_indexes(sync_conn) -> None:
+    # create_all 不会给已存在的表补新索引，这里逐个 checkfirst 补建
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
+
+# PRAGMA user_version 记录已执行过的一次性数据迁移；1 = 旧 hex 文本已改写成 BLOB
+_LEGACY_HEX_DONE_VERSION = 1
+
+
+def _rewrite_legacy_hex(sync_conn) -> None:
+    # 旧库里 id / 摘要列存的是 hex 文本：就地改写成原始字节 BLOB。只在 user_version 未到时跑一次，
+    # 之后启动不再对每张表做全表扫描
+    version = sync_conn.exec_driver_sql("PRAGMA user_version").scalar() or 0
+    if version >= _LEGACY_HEX_DONE_VERSION:
+        return
+    for table in Base.metadata.sorted_tables:
+        for col in table.columns:
+            if not isinstance(col.type, (GUID, LargeBinary)):
+                continue
+            rows = sync_conn.exec_driver_sql(
+                f"SELECT DISTINCT {col.name} FROM {table.name} WHERE typeof({col.name}) = 'text'"
+            ).all()
+            params = []
+            for (v,) in rows:
+                try:
+                    params.append((bytes.fromhex(v), v))
+                except ValueError:
+                    # 不是合法 hex：保持原样，不拦启动
+                    logger.warning("legacy hex rewrite skipped %s.%s value %r", table.name, col.name, v)
+            if params:
+                sync_conn.exec_driver_sql(
+                    f"UPDATE {table.name} SET {col.name} = ? WHERE {col.name} = ?",
+                    params,
+                )
+    sync_conn.exec_driver_sql(f"PRAGMA user_version = {_LEGACY_HEX_DONE_VERSION}")
+
+
 async def init_db() -> None:
     from . import models  # noqa: F401
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_create_missing_indexes)
+        await conn.run_sync(_rewrite_legacy_hex)
+
+
+async def warm_pool() -> None:
+    """
+    启动时把连接池填满，避免首批请求排队建连。
+    """
+    conns = await asyncio.gather(*(engine.connect() for _ in range(settings.DB_POOL_SIZE)))
+    await asyncio.gather(*(c.close() for c in conns))
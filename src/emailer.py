@@ -1,11 +1,41 @@
 from __future__ import annotations
 
+import asyncio
 from email.message import EmailMessage
 import aiosmtplib
 
 from .settings import settings
 
 
+# 每个 worker 复用一条 SMTP 连接（串行发送），省掉每封邮件的 TCP + STARTTLS + AUTH
+_smtp: aiosmtplib.SMTP | None = None
+_smtp_lock = asyncio.Lock()
+
+
+async def _get_smtp() -> aiosmtplib.SMTP:
+    global _smtp
+    if _smtp is None or not _smtp.is_connected:
+        _smtp = aiosmtplib.SMTP(
+            hostname=settings.SMTP_HOST,
+            port=settings.SMTP_PORT,
+            username=settings.SMTP_USERNAME or None,
+            password=settings.SMTP_PASSWORD or None,
+            start_tls=settings.SMTP_TLS,
+        )
+        await _smtp.connect()
+    return _smtp
+
+
+async def close_smtp() -> None:
+    global _smtp
+    if _smtp is not None and _smtp.is_connected:
+        try:
+            await _smtp.quit()
+        except aiosmtplib.SMTPException:
+            _smtp.close()
+    _smtp = None
+
+
 async def send_verification_email(to_email: str, verify_url: str) -> None:
     # 未配置 SMTP 时：开发阶段直接打印，方便你复制验证
     if not settings.SMTP_HOST or not settings.SMTP_FROM:
@@ -18,11 +48,10 @@ async def send_verification_email(to_email: str, verify_url: str) -> None:
     msg["Subject"] = "Verify your email"
     msg.set_content(f"Click to verify your email:\n\n{verify_url}\n")
 
-    await aiosmtplib.send(
-        msg,
-        hostname=settings.SMTP_HOST,
-        port=settings.SMTP_PORT,
-        username=settings.SMTP_USERNAME or None,
-        password=settings.SMTP_PASSWORD or None,
-        start_tls=settings.SMTP_TLS,
-    )
+    async with _smtp_lock:
+        try:
+            await (await _get_smtp()).send_message(msg)
+        except aiosmtplib.SMTPServerDisconnected:
+            # 空闲连接被服务端断开：重连一次再发
+            await close_smtp()
+            await (await _get_smtp()).send_message(msg)
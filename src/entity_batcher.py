@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any
+
+import orjson
+
+from .llm_client import _extract_json_object, get_llm_client
+from .settings import settings
+
+
+ENTITY_FIELDS = ("persons", "locations", "orgs", "events", "keywords")
+
+SYSTEM_SINGLE = (
+    "你是信息抽取器。给定小说问句，抽取可能的实体与关键词。"
+    "只输出严格 JSON，不要输出多余文字。字段：persons, locations, orgs, events, keywords，值为字符串数组。"
+)
+
+SYSTEM_BATCH = (
+    "你是信息抽取器。用户消息是 JSON：{\"queries\": [问句, ...]}，每个问句互相独立。"
+    "对每个问句抽取可能的实体与关键词。"
+    "只输出严格 JSON，不要输出多余文字：{\"items\": [...]}，items 第 i 个元素对应 queries 第 i 个问句，"
+    "元素字段：persons, locations, orgs, events, keywords，值为字符串数组。"
+)
+
+
+def _normalize(data: Any) -> dict[str, Any] | None:
+    if not isinstance(data, dict):
+        return None
+    return {k: data.get(k, []) or [] for k in ENTITY_FIELDS}
+
+
+class EntityBatcher:
+    """
+    实体抽取微批：window 秒内到达的问句合并成一次 LLM 调用（最多 max_batch 条），
+    调用方各自 await 自己的 Future，接口与单条调用一致。
+    没有排队也没有在途批次时立即发出，不白等窗口；出错按问句各自降级为 None。
+    """
+
+    def __init__(self, window: float, max_batch: int) -> None:
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: list[tuple[str, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def extract(self, question: str) -> dict[str, Any] | None:
+        """
+        返回归一化的实体包；LLM 输出无法解析时返回 None，由调用方兜底。
+        """
+        loop = asyncio.get_running_loop()
+        fut: asyncio.Future = loop.create_future()
+        self._pending.append((question, fut))
+        if len(self._pending) >= self.max_batch or (len(self._pending) == 1 and not self._tasks):
+            # 满批，或者当前空闲（无排队、无在途）：立即发出
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await fut
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: list[tuple[str, asyncio.Future]]) -> None:
+        try:
+            if len(batch) == 1:
+                results = [await self._call_single(batch[0][0])]
+            else:
+                results = await self._call_batch([q for q, _ in batch])
+        except Exception:
+            # 兜底：不让一个错误扩散到同窗口的所有调用方，统一按抽取失败处理
+            results = [None] * len(batch)
+        for (_, fut), ent in zip(batch, results):
+            # 调用方可能已取消
+            if not fut.done():
+                fut.set_result(ent)
+
+    async def _chat(self, system: str, user: str) -> str:
+        resp = await get_llm_client().chat_completion_async(
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": user},
+            ],
+            stream=False,
+            temperature=0.0,
+        )
+        return (resp["choices"][0]["message"].get("content") or "").strip()
+
+    async def _call_single(self, question: str) -> dict[str, Any] | None:
+        try:
+            content = await self._chat(SYSTEM_SINGLE, question)
+            return _normalize(orjson.loads(content))
+        except Exception:
+            # 传输/HTTP 错误或输出不是 JSON：只影响这一个问句，调用方走关键词兜底
+            return None
+
+    async def _call_batch(self, questions: list[str]) -> list[dict[str, Any] | None]:
+        user = orjson.dumps({"queries": questions}).decode()
+        try:
+            items = _extract_json_object(await self._chat(SYSTEM_BATCH, user)).get("items")
+        except Exception:
+            items = None
+        if isinstance(items, list) and len(items) == len(questions):
+            return [_normalize(it) for it in items]
+        # 批量调用失败或结果对不齐：退回逐条调用，单条出错只让该问句得到 None
+        results = await asyncio.gather(*(self._call_single(q) for q in questions), return_exceptions=True)
+        return [None if isinstance(r, BaseException) else r for r in results]
+
+
+entity_batcher = EntityBatcher(
+    window=settings.ENTITY_BATCH_WINDOW_S,
+    max_batch=settings.ENTITY_BATCH_MAX,
+)
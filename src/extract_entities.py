@@ -1,25 +1,34 @@
 from __future__ import annotations
 
 import argparse
+import asyncio
 from pathlib import Path
 from typing import Any, Dict, List
 
-from io_utils import read_jsonl, append_jsonl, load_done_ids
+from io_utils import read_jsonl, JsonlSink, load_done_ids
 from llm_client import DeepSeekClient
 
 
 SYSTEM_PROMPT = "你是一个严格的结构化信息抽取器。必须只输出 JSON。禁止输出多余文字。"
 
 
-def _render(prompt_template: str, chunk: dict) -> str:
-    filled = (
+def _build_system(prompt_template: str) -> str:
+    """
+    静态指令全部放进 system，跨调用逐字节一致，便于命中服务端前缀缓存。
+    模板里的 {chunk_id}/{chapter_id} 改为指向用户消息，不再逐条替换。
+    """
+    template = (
         prompt_template
-        .replace("{chunk_id}", chunk["chunk_id"])
-        .replace("{chapter_id}", chunk["chapter_id"])
+        .replace("{chunk_id}", "见用户消息")
+        .replace("{chapter_id}", "见用户消息")
     )
-    return f'{filled}\n\n"""' + chunk["text"] + '"""'
+    return f"{SYSTEM_PROMPT}\n\n{template}"
 
 
+def _render(chunk: dict) -> str:
+    # user 只放变化的部分：短 id 后缀 + 原文
+    return f'chunk_id={chunk["chunk_id"]}\nchapter_id={chunk["chapter_id"]}\n"""{chunk["text"]}"""'
+
 
 def _sanitize(obj: Dict[str, Any], chunk: Dict[str, Any]) -> Dict[str, Any]:
     obj["chunk_id"] = chunk["chunk_id"]
@@ -65,42 +74,57 @@ def _sanitize(obj: Dict[str, Any], chunk: Dict[str, Any]) -> Dict[str, Any]:
     return obj
 
 
-def main() -> None:
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--chunks", default="data/processed/chunks.jsonl")
-    ap.add_argument("--out", default="data/processed/entities_raw.jsonl")
-    ap.add_argument("--prompt", default="prompts/entities.prompt.txt")
-    ap.add_argument("--limit", type=int, default=0)
-    ap.add_argument("--resume", action="store_true")
-    args = ap.parse_args()
-
+async def _run(args: argparse.Namespace) -> None:
     chunks_path = Path(args.chunks)
     out_path = Path(args.out)
-    prompt_template = Path(args.prompt).read_text(encoding="utf-8")
+    system = _build_system(Path(args.prompt).read_text(encoding="utf-8"))
 
     done = load_done_ids(out_path, "chunk_id") if args.resume else set()
 
-    client = DeepSeekClient()
-
-    processed = 0
+    pending: List[Dict[str, Any]] = []
     for chunk in read_jsonl(chunks_path):
-        if args.limit and processed >= args.limit:
+        if args.limit and len(pending) >= args.limit:
             break
-        cid = chunk["chunk_id"]
-        if cid in done:
+        if chunk["chunk_id"] in done:
             continue
+        pending.append(chunk)
 
-        user = _render(prompt_template, chunk)
-        obj = client.chat_json(system=SYSTEM_PROMPT, user=user)
-        obj = _sanitize(obj, chunk)
+    client = DeepSeekClient()
+    sem = asyncio.Semaphore(max(1, args.concurrency))
+
+    async def work(chunk: Dict[str, Any]) -> Dict[str, Any]:
+        async with sem:
+            obj = await client.chat_json_async(system=system, user=_render(chunk))
+        return _sanitize(obj, chunk)
 
-        append_jsonl(out_path, obj)
-        processed += 1
-        if processed % 10 == 0:
-            print(f"[entities] processed={processed} last={cid}")
+    # 并发请求、按输入顺序落盘：输出顺序与串行版一致，--resume 语义不变
+    tasks = [asyncio.create_task(work(c)) for c in pending]
+    processed = 0
+    try:
+        with JsonlSink(out_path, id_field="chunk_id") as sink:
+            for chunk, task in zip(pending, tasks):
+                sink.write(await task)
+                processed += 1
+                if processed % 10 == 0:
+                    print(f"[entities] processed={processed} last={chunk['chunk_id']}")
+    finally:
+        for t in tasks:
+            t.cancel()
 
     print(f"[entities] DONE total_processed={processed} out={out_path.resolve()}")
 
 
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chunks", default="data/processed/chunks.jsonl")
+    ap.add_argument("--out", default="data/processed/entities_raw.jsonl")
+    ap.add_argument("--prompt", default="prompts/entities.prompt.txt")
+    ap.add_argument("--limit", type=int, default=0)
+    ap.add_argument("--resume", action="store_true")
+    ap.add_argument("--concurrency", type=int, default=8)
+    args = ap.parse_args()
+    asyncio.run(_run(args))
+
+
 if __name__ == "__main__":
     main()
@@ -1,11 +1,12 @@
 from __future__ import annotations
 
 import argparse
+import asyncio
 import json
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Set, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
-from io_utils import read_jsonl, append_jsonl, load_done_ids
+from io_utils import read_jsonl, read_jsonl_all, JsonlSink, load_done_ids
 from llm_client import DeepSeekClient
 
 
@@ -13,13 +14,7 @@ SYSTEM_PROMPT = "你是一个严格的结构化信息抽取器。必须只输出
 
 
 def _uniq_keep_order(items: List[str]) -> List[str]:
-    seen: Set[str] = set()
-    out: List[str] = []
-    for x in items:
-        if x not in seen:
-            seen.add(x)
-            out.append(x)
-    return out
+    return list(dict.fromkeys(items))
 
 
 def _load_entity_candidates(entities_path: Path) -> Dict[str, Dict[str, List[str]]]:
@@ -29,7 +24,7 @@ def _load_entity_candidates(entities_path: Path) -> Dict[str, Dict[str, List[str
     """
     idx: Dict[str, Dict[str, List[str]]] = {}
 
-    for row in read_jsonl(entities_path):
+    for row in read_jsonl_all(entities_path):
         if not isinstance(row, dict):
             continue
         cid = row.get("chunk_id")
@@ -69,41 +64,46 @@ def _load_entity_candidates(entities_path: Path) -> Dict[str, Dict[str, List[str
     return idx
 
 
+_CANDIDATE_RULES = (
+    "【实体候选】\n"
+    "用户消息中会给出 persons / places / orgs 候选（来自 entities_raw，可为空）。\n"
+    "\n【使用规则】\n"
+    "- participants[].name 优先从 persons 中选；如果原文没有明确姓名，则 name 必须为 null，并把原文称呼写入 mention。\n"
+    "- place.name 优先从 places/orgs 中选；如果原文没有明确地点，则 place 必须为 null。\n"
+    "- 禁止编造不在原文中的人名/地名。\n"
+)
+
+
+def _build_system(prompt_template: str, with_candidates: bool) -> str:
+    """
+    静态指令（模板 + 候选使用规则）全部放进 system，跨调用逐字节一致，便于命中前缀缓存。
+    """
+    template = (
+        prompt_template
+        .replace("{chunk_id}", "见用户消息")
+        .replace("{chapter_id}", "见用户消息")
+    )
+    system = f"{SYSTEM_PROMPT}\n\n{template}"
+    if with_candidates:
+        system += f"\n\n{_CANDIDATE_RULES}"
+    return system
+
+
 def _render(
-    prompt_template: str,
     chunk: dict,
     candidates: Optional[Dict[str, List[str]]] = None,
 ) -> str:
-    filled = (
-        prompt_template
-        .replace("{chunk_id}", chunk["chunk_id"])
-        .replace("{chapter_id}", chunk["chapter_id"])
-    )
+    head = f'chunk_id={chunk["chunk_id"]}\nchapter_id={chunk["chapter_id"]}\n'
 
-    # 把候选实体拼到 prompt 里（不要求你改 prompts/events.prompt.txt）
+    # 每个 chunk 的候选实体属于变化部分，放在 user 里
     cand_block = ""
     if candidates is not None:
-        persons = candidates.get("persons", [])
-        places = candidates.get("places", [])
-        orgs = candidates.get("orgs", [])
-
-        # 为避免 prompt 过长：这里不强制截断，你也可以改成 [:30]
-        persons_json = json.dumps(persons, ensure_ascii=False)
-        places_json = json.dumps(places, ensure_ascii=False)
-        orgs_json = json.dumps(orgs, ensure_ascii=False)
-
-        cand_block = (
-            "\n\n【实体候选（来自 entities_raw，可为空）】\n"
-            f"- persons: {persons_json}\n"
-            f"- places: {places_json}\n"
-            f"- orgs: {orgs_json}\n"
-            "\n【使用规则】\n"
-            "- participants[].name 优先从 persons 中选；如果原文没有明确姓名，则 name 必须为 null，并把原文称呼写入 mention。\n"
-            "- place.name 优先从 places/orgs 中选；如果原文没有明确地点，则 place 必须为 null。\n"
-            "- 禁止编造不在原文中的人名/地名。\n"
-        )
+        persons_json = json.dumps(candidates.get("persons", []), ensure_ascii=False)
+        places_json = json.dumps(candidates.get("places", []), ensure_ascii=False)
+        orgs_json = json.dumps(candidates.get("orgs", []), ensure_ascii=False)
+        cand_block = f"persons={persons_json}\nplaces={places_json}\norgs={orgs_json}\n"
 
-    return f'{filled}{cand_block}\n\n"""' + chunk["text"] + '"""'
+    return f'{head}{cand_block}"""{chunk["text"]}"""'
 
 
 def _sanitize(obj: Dict[str, Any], chunk: Dict[str, Any]) -> Dict[str, Any]:
@@ -126,19 +126,7 @@ def _sanitize(obj: Dict[str, Any], chunk: Dict[str, Any]) -> Dict[str, Any]:
     return obj
 
 
-def main() -> None:
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--chunks", default="data/processed/chunks.jsonl")
-    ap.add_argument("--out", default="data/processed/events_raw.jsonl")
-    ap.add_argument("--prompt", default="prompts/events.prompt.txt")
-
-    # 新增：实体候选输入（可选）
-    ap.add_argument("--entities", default="")  # e.g. data/processed/entities_raw.jsonl
-
-    ap.add_argument("--limit", type=int, default=0)
-    ap.add_argument("--resume", action="store_true")
-    args = ap.parse_args()
-
+async def _run(args: argparse.Namespace) -> None:
     chunks_path = Path(args.chunks)
     out_path = Path(args.out)
     prompt_path = Path(args.prompt)
@@ -156,36 +144,68 @@ def main() -> None:
             raise FileNotFoundError(f"entities file not found: {entities_path}")
         entity_index = _load_entity_candidates(entities_path)
 
-    done = load_done_ids(out_path, "chunk_id") if args.resume else set()
+    system = _build_system(prompt_template, with_candidates=entity_index is not None)
 
-    client = DeepSeekClient()
+    done = load_done_ids(out_path, "chunk_id") if args.resume else set()
 
-    processed = 0
+    pending: List[Dict[str, Any]] = []
     for chunk in read_jsonl(chunks_path):
-        if args.limit and processed >= args.limit:
+        if args.limit and len(pending) >= args.limit:
             break
         cid = chunk.get("chunk_id")
         if not isinstance(cid, str) or not cid:
             continue
         if cid in done:
             continue
+        pending.append(chunk)
+
+    client = DeepSeekClient()
+    sem = asyncio.Semaphore(max(1, args.concurrency))
 
-        candidates = entity_index.get(cid) if entity_index is not None else None
-        user = _render(prompt_template, chunk, candidates=candidates)
+    async def work(chunk: Dict[str, Any]) -> Dict[str, Any]:
+        candidates = None
+        if entity_index is not None:
+            candidates = entity_index.get(chunk["chunk_id"]) or {"persons": [], "places": [], "orgs": []}
+        user = _render(chunk, candidates=candidates)
 
-        obj = client.chat_json(system=SYSTEM_PROMPT, user=user)
+        async with sem:
+            obj = await client.chat_json_async(system=system, user=user)
         if not isinstance(obj, dict):
             obj = {"events": []}
+        return _sanitize(obj, chunk)
 
-        obj = _sanitize(obj, chunk)
-        append_jsonl(out_path, obj)
-
-        processed += 1
-        if processed % 10 == 0:
-            print(f"[events] processed={processed} last={cid}")
+    # 并发请求、按输入顺序落盘：输出顺序与串行版一致，--resume 语义不变
+    tasks = [asyncio.create_task(work(c)) for c in pending]
+    processed = 0
+    try:
+        with JsonlSink(out_path, id_field="chunk_id") as sink:
+            for chunk, task in zip(pending, tasks):
+                sink.write(await task)
+                processed += 1
+                if processed % 10 == 0:
+                    print(f"[events] processed={processed} last={chunk['chunk_id']}")
+    finally:
+        for t in tasks:
+            t.cancel()
 
     print(f"[events] DONE total_processed={processed} out={out_path.resolve()}")
 
 
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chunks", default="data/processed/chunks.jsonl")
+    ap.add_argument("--out", default="data/processed/events_raw.jsonl")
+    ap.add_argument("--prompt", default="prompts/events.prompt.txt")
+
+    # 新增：实体候选输入（可选）
+    ap.add_argument("--entities", default="")  # e.g. data/processed/entities_raw.jsonl
+
+    ap.add_argument("--limit", type=int, default=0)
+    ap.add_argument("--resume", action="store_true")
+    ap.add_argument("--concurrency", type=int, default=8)
+    args = ap.parse_args()
+    asyncio.run(_run(args))
+
+
 if __name__ == "__main__":
     main()
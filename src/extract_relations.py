@@ -1,12 +1,14 @@
 from __future__ import annotations
 
 import argparse
-import json
+import asyncio
+import re
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Set
 
-from io_utils import read_jsonl, append_jsonl, load_done_ids
+from io_utils import read_jsonl, JsonlSink, load_done_ids
 from llm_client import DeepSeekClient
+from settings import settings
 
 
 SYSTEM_PROMPT = "你是一个严格的结构化信息抽取器。必须只输出 JSON。禁止输出多余文字。"
@@ -20,32 +22,30 @@ def load_people_candidates(entities_raw_path: Optional[Path]) -> Dict[str, List[
     if not entities_raw_path or not entities_raw_path.exists():
         return {}
 
-    m: Dict[str, List[str]] = {}
-    with entities_raw_path.open("r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            obj = json.loads(line)
-            cid = obj.get("chunk_id")
-            ents = obj.get("entities", [])
-            if not isinstance(cid, str) or not isinstance(ents, list):
-                continue
-            people = []
-            for e in ents:
-                if isinstance(e, dict) and e.get("type") == "Person" and isinstance(e.get("name"), str):
-                    people.append(e["name"])
-            if people:
-                m[cid] = sorted(set(people))
-    return m
-
-
-def _render(prompt_template: str, chunk: dict, candidates: list[str]) -> str:
-    filled = (
-        prompt_template
-        .replace("{chunk_id}", chunk["chunk_id"])
-        .replace("{chapter_id}", chunk["chapter_id"])
-    )
+    people: Dict[str, Set[str]] = {}
+    for obj in read_jsonl(entities_raw_path):
+        cid = obj.get("chunk_id")
+        ents = obj.get("entities", [])
+        if not isinstance(cid, str) or not isinstance(ents, list):
+            continue
+        for e in ents:
+            if isinstance(e, dict) and e.get("type") == "Person" and isinstance(e.get("name"), str):
+                people.setdefault(cid, set()).add(e["name"])
+    return {cid: sorted(names) for cid, names in people.items()}
+
+
+_SLOT_RE = re.compile(r"\{(chunk_id|chapter_id)\}")
+
+
+def _compile_template(prompt_template: str) -> List[str]:
+    """
+    启动时切一次：[字面量, 槽位名, 字面量, 槽位名, ...]，逐条渲染只做一次 join。
+    """
+    return _SLOT_RE.split(prompt_template)
+
+
+def _render(template_parts: List[str], chunk: dict, candidates: list[str]) -> str:
+    filled = "".join(chunk[p] if i % 2 else p for i, p in enumerate(template_parts))
     cand_text = ", ".join(candidates) if candidates else ""
     return f"""{filled}
 
@@ -55,6 +55,57 @@ candidate_people: {cand_text}
 """
 
 
+_BATCH_RULES = (
+    "【批量输入】\n"
+    "用户消息中包含多个 <<<CHUNK i=... chunk_id=... chapter_id=... candidate_people=...>>> ... <<<END>>> 块，"
+    "每块是一个独立的 text，互不参考。\n"
+    "\n【批量输出】\n"
+    '只输出一个 JSON 对象：{"items": [...]}，items 第 i 个元素对应 CHUNK i，'
+    "格式与上面的单块输出相同（chunk_id/chapter_id 照抄块头）。块数与 items 数必须一致。\n"
+)
+
+
+def _build_batch_system(prompt_template: str) -> str:
+    # 模板 + 批量规则放进 system，一次运行内逐字节不变
+    template = (
+        prompt_template
+        .replace("{chunk_id}", "见各 CHUNK 块头")
+        .replace("{chapter_id}", "见各 CHUNK 块头")
+    )
+    return f"{SYSTEM_PROMPT}\n\n{template}\n\n{_BATCH_RULES}"
+
+
+def _render_batch(chunks: List[Dict[str, Any]], candidates_map: Dict[str, List[str]]) -> str:
+    parts = []
+    for i, chunk in enumerate(chunks):
+        cand_text = ", ".join(candidates_map.get(chunk["chunk_id"], []))
+        parts.append(
+            f'<<<CHUNK i={i} chunk_id={chunk["chunk_id"]} chapter_id={chunk["chapter_id"]} '
+            f'candidate_people={cand_text}>>>\n{chunk["text"]}\n<<<END>>>'
+        )
+    return "\n\n".join(parts)
+
+
+def _split_batch(obj: Dict[str, Any], chunks: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+    """
+    按 chunk_id 对齐，对不上再按下标兜底；缺失的位置返回 None，由调用方单条重试。
+    """
+    items = obj.get("items") if isinstance(obj, dict) else None
+    if not isinstance(items, list):
+        return [None] * len(chunks)
+
+    by_id = {it.get("chunk_id"): it for it in items if isinstance(it, dict)}
+    out: List[Optional[Dict[str, Any]]] = []
+    for i, chunk in enumerate(chunks):
+        it = by_id.get(chunk["chunk_id"])
+        if it is None and len(items) == len(chunks) and isinstance(items[i], dict):
+            # 下标兜底只收 chunk_id 缺省或一致的项；标错的不挪给别的 chunk，交给单条重抽
+            if items[i].get("chunk_id") in (None, "", chunk["chunk_id"]):
+                it = items[i]
+        out.append(it)
+    return out
+
+
 def _sanitize(obj: Dict[str, Any], chunk: Dict[str, Any]) -> Dict[str, Any]:
     obj["chunk_id"] = chunk["chunk_id"]
     obj["chapter_id"] = chunk["chapter_id"]
@@ -74,17 +125,7 @@ def _sanitize(obj: Dict[str, Any], chunk: Dict[str, Any]) -> Dict[str, Any]:
     return obj
 
 
-def main() -> None:
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--chunks", default="data/processed/chunks.jsonl")
-    ap.add_argument("--out", default="data/processed/relations_raw.jsonl")
-    ap.add_argument("--prompt", default="prompts/relations.prompt.txt")
-    ap.add_argument("--entities_raw", default="data/processed/entities_raw.jsonl",
-                    help="可选：用于给关系抽取提供候选人物名单（强烈推荐先跑实体再跑关系）")
-    ap.add_argument("--limit", type=int, default=0)
-    ap.add_argument("--resume", action="store_true")
-    args = ap.parse_args()
-
+async def _run(args: argparse.Namespace) -> None:
     chunks_path = Path(args.chunks)
     out_path = Path(args.out)
     prompt_template = Path(args.prompt).read_text(encoding="utf-8")
@@ -93,28 +134,80 @@ def main() -> None:
 
     candidates_map = load_people_candidates(Path(args.entities_raw)) if args.entities_raw else {}
 
-    client = DeepSeekClient()
-
-    processed = 0
+    # 先按 done/limit 选出待处理 chunk，再切批；提交任务前就确定，保证可复现
+    pending: List[Dict[str, Any]] = []
     for chunk in read_jsonl(chunks_path):
-        if args.limit and processed >= args.limit:
+        if args.limit and len(pending) >= args.limit:
             break
-        cid = chunk["chunk_id"]
-        if cid in done:
+        if chunk["chunk_id"] in done:
             continue
+        pending.append(chunk)
+    size = max(1, args.batch_size)
+    batches = [pending[i:i + size] for i in range(0, len(pending), size)]
 
-        candidates = candidates_map.get(cid, [])
-        user = _render(prompt_template, chunk, candidates)
-        obj = client.chat_json(system=SYSTEM_PROMPT, user=user)
-        obj = _sanitize(obj, chunk)
-
-        append_jsonl(out_path, obj)
-        processed += 1
-        if processed % 10 == 0:
-            print(f"[relations] processed={processed} last={cid}")
+    client = DeepSeekClient()
+    sem = asyncio.Semaphore(max(1, args.concurrency))
+    batch_system = _build_batch_system(prompt_template)
+    template_parts = _compile_template(prompt_template)
+
+    async def extract_one(chunk: Dict[str, Any]) -> Dict[str, Any]:
+        user = _render(template_parts, chunk, candidates_map.get(chunk["chunk_id"], []))
+        async with sem:
+            obj = await client.chat_json_async(system=SYSTEM_PROMPT, user=user)
+        return _sanitize(obj, chunk)
+
+    async def extract_batch(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if len(chunks) == 1:
+            return [await extract_one(chunks[0])]
+        try:
+            async with sem:
+                obj = await client.chat_json_async(
+                    system=batch_system,
+                    user=_render_batch(chunks, candidates_map),
+                    max_tokens=settings.MAX_TOKENS * len(chunks),
+                )
+        except Exception as e:
+            # 整批回复被截断/解析失败：这一批逐条重抽，不让一批的失败中断整个运行
+            print(f"[relations] batch failed, retrying one by one: first={chunks[0]['chunk_id']} err={e}")
+            return [await extract_one(chunk) for chunk in chunks]
+        return [
+            _sanitize(it, chunk) if it is not None else await extract_one(chunk)
+            for chunk, it in zip(chunks, _split_batch(obj, chunks))
+        ]
+
+    # 并发请求、按输入顺序落盘：输出顺序与串行版一致
+    tasks = [asyncio.create_task(extract_batch(b)) for b in batches]
+    processed = 0
+    try:
+        with JsonlSink(out_path, id_field="chunk_id") as sink:
+            for task in tasks:
+                for obj in await task:
+                    sink.write(obj)
+                    processed += 1
+                    if processed % 10 == 0:
+                        print(f"[relations] processed={processed} last={obj['chunk_id']}")
+    finally:
+        for t in tasks:
+            t.cancel()
 
     print(f"[relations] DONE total_processed={processed} out={out_path.resolve()}")
 
 
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chunks", default="data/processed/chunks.jsonl")
+    ap.add_argument("--out", default="data/processed/relations_raw.jsonl")
+    ap.add_argument("--prompt", default="prompts/relations.prompt.txt")
+    ap.add_argument("--entities_raw", default="data/processed/entities_raw.jsonl",
+                    help="可选：用于给关系抽取提供候选人物名单（强烈推荐先跑实体再跑关系）")
+    ap.add_argument("--limit", type=int, default=0)
+    ap.add_argument("--resume", action="store_true")
+    ap.add_argument("--batch_size", type=int, default=4,
+                    help="每次 LLM 调用打包的 chunk 数；1 = 逐条抽取")
+    ap.add_argument("--concurrency", type=int, default=8)
+    args = ap.parse_args()
+    asyncio.run(_run(args))
+
+
 if __name__ == "__main__":
     main()
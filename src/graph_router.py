@@ -1,15 +1,19 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from neo4j import AsyncDriver
+import hashlib
+from functools import lru_cache
 
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import ORJSONResponse
+from neo4j import AsyncDriver, Record, RoutingControl
+
+from .cache import TTLCache
 from .neo4j_client import get_neo4j_driver
 from .settings import settings
 from .graph_schemas import (
     CatalogResponse,
-    EntityListItem,
     EntityListResponse,
-    EvidenceItem,
     EvidenceResponse,
     GraphResponse,
     SubgraphRequest,
@@ -24,6 +28,38 @@ def _clamp(v: int, lo: int, hi: int) -> int:
     return max(lo, min(hi, v))
 
 
+async def _read(driver: AsyncDriver, cypher: str, **params) -> list[Record]:
+    # 只读查询走 execute_query：驱动内部管理会话与重试，按 READ 路由
+    records, _, _ = await driver.execute_query(
+        cypher,
+        parameters_=params,
+        database_=settings.NEO4J_DATABASE,
+        routing_=RoutingControl.READ,
+    )
+    return records
+
+
+def _first(records: list[Record]) -> Record | None:
+    return records[0] if records else None
+
+
+# 近静态数据（导入任务之间不变）：缓存编码后的响应体 + ETag
+_static_cache = TTLCache(maxsize=10_000, ttl=60)
+CATALOG_TTL_S = 30
+
+
+def _etag_response(request: Request, body: bytes, etag: str) -> Response:
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def _encode_with_etag(payload: object) -> tuple[bytes, str]:
+    body = orjson.dumps(payload)
+    return body, f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
 def _validate_eid(eid: str, field_name: str = "eid") -> None:
     # elementId 形如 "4:xxxx:123"，一定包含冒号
     if not eid or ":" not in eid:
@@ -35,22 +71,27 @@ def _validate_eid(eid: str, field_name: str = "eid") -> None:
 # =========================
 
 @router.get("/catalog", response_model=CatalogResponse)
-async def get_catalog(driver: AsyncDriver = Depends(get_neo4j_driver)) -> CatalogResponse:
+async def get_catalog(request: Request, driver: AsyncDriver = Depends(get_neo4j_driver)) -> Response:
     """
     左侧目录总数：Person / Event
     """
+    cached = _static_cache.get(("catalog",))
+    if cached is not None:
+        return _etag_response(request, *cached)
+
     cypher = """
     CALL { MATCH (p:Person) RETURN count(p) AS person_count }
     CALL { MATCH (e:Event)  RETURN count(e) AS event_count }
     RETURN person_count, event_count
     """
-    async with driver.session(database=settings.NEO4J_DATABASE) as session:
-        rec = await (await session.run(cypher)).single()
+    rec = _first(await _read(driver, cypher))
 
-    return CatalogResponse(
-        person_count=int((rec and rec["person_count"]) or 0),
-        event_count=int((rec and rec["event_count"]) or 0),
-    )
+    cached = _encode_with_etag({
+        "person_count": int((rec and rec["person_count"]) or 0),
+        "event_count": int((rec and rec["event_count"]) or 0),
+    })
+    _static_cache.set(("catalog",), cached, ttl=CATALOG_TTL_S)
+    return _etag_response(request, *cached)
 
 
 @router.get("/search/person")
@@ -60,7 +101,7 @@ async def search_person(
     driver: AsyncDriver = Depends(get_neo4j_driver),
 ) -> list[dict]:
     """
-    给前端搜索人物起点：返回 elementId + name
+    给前端搜索人物起点：返回 elementId + name（CONTAINS 由 person_name_text 索引支撑）
     """
     cypher = """
     MATCH (p:Person)
@@ -69,8 +110,7 @@ async def search_person(
     ORDER BY name ASC
     LIMIT $limit
     """
-    async with driver.session(database=settings.NEO4J_DATABASE) as session:
-        rows = await (await session.run(cypher, q=q, limit=limit)).data()
+    rows = [r.data() for r in await _read(driver, cypher, q=q, limit=limit)]
 
     return [{"eid": r["eid"], "name": r.get("name")} for r in rows]
 
@@ -83,10 +123,10 @@ async def list_entities(
     limit: int = Query(50, ge=1, le=200),
     offset: int = Query(0, ge=0),
     driver: AsyncDriver = Depends(get_neo4j_driver),
-) -> EntityListResponse:
+) -> ORJSONResponse:
     """
     左侧列表：分页列出 Person/Event
-    score 默认用“提及次数/证据次数”实时计算（PoC 够用，后期可预计算）
+    score 读预计算的 n.mention_count（neo4j_writer 导入时写入；旧图用 neo4j_writer --only_mention_counts 补一次）
     """
     if label not in ALLOWED_LABELS:
         raise HTTPException(status_code=400, detail="label must be Person or Event")
@@ -95,17 +135,19 @@ async def list_entities(
 
     q = q or ""
 
+    # q 为空时走纯 label 扫描；否则单独一个谓词，让 TEXT 索引接管 CONTAINS（`$q = '' OR ...` 会挡住索引）
     if label == "Person":
-        total_cypher = """
+        where = "WHERE n.name CONTAINS $q" if q else ""
+        total_cypher = f"""
         MATCH (n:Person)
-        WHERE $q = '' OR n.name CONTAINS $q
+        {where}
         RETURN count(n) AS total
         """
-        base_cypher = """
+        base_cypher = f"""
         MATCH (n:Person)
-        WHERE $q = '' OR n.name CONTAINS $q
-        WITH n, count { (n)-[:MENTIONED_IN]->(:Chunk) } AS score
-        RETURN
+        {where}
+        WITH n, coalesce(n.mention_count, 0) AS score
+        WITH
           elementId(n) AS eid,
           'Person' AS label,
           n.name AS name,
@@ -114,19 +156,21 @@ async def list_entities(
           n.first_seen_chunk AS first_seen_chunk
         """
     else:
-        total_cypher = """
+        # 导入只写 summary / trigger（没有 title / name），搜索走 summary，由 event_summary_text 索引支撑
+        where = "WHERE n.summary CONTAINS $q" if q else ""
+        total_cypher = f"""
         MATCH (n:Event)
-        WHERE $q = '' OR coalesce(n.title, n.name) CONTAINS $q
+        {where}
         RETURN count(n) AS total
         """
-        base_cypher = """
+        base_cypher = f"""
         MATCH (n:Event)
-        WHERE $q = '' OR coalesce(n.title, n.name) CONTAINS $q
-        WITH n, count { (n)-[:MENTIONED_IN]->(:Chunk) } AS score
-        RETURN
+        {where}
+        WITH n, coalesce(n.mention_count, 0) AS score
+        WITH
           elementId(n) AS eid,
           'Event' AS label,
-          coalesce(n.title, n.name) AS name,
+          coalesce(n.title, n.name, n.summary) AS name,
           score AS score,
           n.first_seen_chapter AS first_seen_chapter,
           n.first_seen_chunk AS first_seen_chunk
@@ -139,26 +183,30 @@ async def list_entities(
     else:
         order_by = "ORDER BY first_seen_chapter ASC, first_seen_chunk ASC, name ASC"
 
-    list_cypher = f"{base_cypher}\n{order_by}\nSKIP $offset LIMIT $limit"
+    # total 与分页放进同一条语句的两个子查询：一次往返；分页先 collect，空页也保留 total
+    cypher = f"""
+    CALL {{
+      {total_cypher}
+    }}
+    CALL {{
+      {base_cypher}
+      {order_by}
+      SKIP $offset LIMIT $limit
+      RETURN collect({{
+        eid: eid, label: label, name: name, score: score,
+        first_seen_chapter: first_seen_chapter, first_seen_chunk: first_seen_chunk
+      }}) AS rows
+    }}
+    RETURN total, rows
+    """
 
-    async with driver.session(database=settings.NEO4J_DATABASE) as session:
-        total_rec = await (await session.run(total_cypher, q=q)).single()
-        total = int((total_rec and total_rec["total"]) or 0)
+    rec = _first(await _read(driver, cypher, q=q, offset=offset, limit=limit))
 
-        rows = await (await session.run(list_cypher, q=q, offset=offset, limit=limit)).data()
+    total = int((rec and rec["total"]) or 0)
+    rows = (rec and rec["rows"]) or []
 
-    items = [
-        EntityListItem(
-            eid=row["eid"],
-            label=row["label"],
-            name=row.get("name"),
-            score=int(row.get("score") or 0),
-            first_seen_chapter=row.get("first_seen_chapter"),
-            first_seen_chunk=row.get("first_seen_chunk"),
-        )
-        for row in rows
-    ]
-    return EntityListResponse(items=items, total=total)
+    # 行已在 Cypher 里投影成响应形状：跳过 Pydantic 逐行校验，直接 orjson 编码
+    return ORJSONResponse({"items": rows, "total": total})
 
 
 # =========================
@@ -168,31 +216,39 @@ async def list_entities(
 @router.get("/node/by-eid/{eid}")
 async def get_node_detail(
     eid: str,
+    request: Request,
     driver: AsyncDriver = Depends(get_neo4j_driver),
-) -> dict:
+) -> Response:
     """
     节点详情：返回 labels + properties
     注意：Chunk 详情不返回 text（全文使用 /chunks/by-eid）
     """
     _validate_eid(eid, "eid")
 
+    cached = _static_cache.get(("node", eid))
+    if cached is not None:
+        return _etag_response(request, *cached)
+
+    # Chunk 在服务端就投影掉 text，不让全文走 Bolt
     cypher = """
     MATCH (n) WHERE elementId(n) = $eid
-    RETURN labels(n) AS labels, properties(n) AS props
+    WITH n, labels(n) AS labels
+    RETURN
+      labels,
+      CASE
+        WHEN 'Chunk' IN labels
+          THEN n {.chunk_id, .chapter_id, .book_title, .start_char, .end_char}
+        ELSE properties(n)
+      END AS props
     """
-    async with driver.session(database=settings.NEO4J_DATABASE) as session:
-        rec = await (await session.run(cypher, eid=eid)).single()
+    rec = _first(await _read(driver, cypher, eid=eid))
 
     if rec is None:
         raise HTTPException(status_code=404, detail="Node not found")
 
-    labels = rec["labels"] or []
-    props = rec["props"] or {}
-
-    if "Chunk" in labels and "text" in props:
-        props.pop("text", None)
-
-    return {"eid": eid, "labels": labels, "properties": props}
+    cached = _encode_with_etag({"eid": eid, "labels": rec["labels"] or [], "properties": rec["props"] or {}})
+    _static_cache.set(("node", eid), cached)
+    return _etag_response(request, *cached)
 
 
 @router.get("/evidence", response_model=EvidenceResponse)
@@ -201,7 +257,7 @@ async def get_evidence(
     limit: int = Query(20, ge=1, le=200),
     snippet_len: int = Query(120, ge=0, le=settings.GRAPH_MAX_SNIPPET_LEN),
     driver: AsyncDriver = Depends(get_neo4j_driver),
-) -> EvidenceResponse:
+) -> ORJSONResponse:
     """
     证据列表：返回关联 Chunk 的 snippet（不返回全文）
     """
@@ -224,46 +280,23 @@ async def get_evidence(
     LIMIT $limit
     """
 
-    async with driver.session(database=settings.NEO4J_DATABASE) as session:
-        rows = await (await session.run(cypher, eid=eid, limit=limit, snippet_len=snippet_len)).data()
-
-    items = [
-        EvidenceItem(
-            chunk_eid=r["chunk_eid"],
-            chunk_id=r.get("chunk_id"),
-            chapter_id=r.get("chapter_id"),
-            start_char=r.get("start_char"),
-            end_char=r.get("end_char"),
-            snippet=r.get("snippet"),
-        )
-        for r in rows
-    ]
-    return EvidenceResponse(items=items)
+    records = await _read(driver, cypher, eid=eid, limit=limit, snippet_len=snippet_len)
+    return ORJSONResponse({"items": [r.data() for r in records]})
 
 
 # =========================
 # ✅ Missing endpoints (你缺的两个)
 # =========================
 
-@router.post("/subgraph", response_model=GraphResponse)
-async def get_subgraph(
-    req: SubgraphRequest,
-    driver: AsyncDriver = Depends(get_neo4j_driver),
-) -> GraphResponse:
+@lru_cache(maxsize=None)
+def _subgraph_cypher(direction: str, depth: int) -> str:
     """
-    ✅ POST /graph/subgraph
-    获取子图：从 seed_eid 出发展开 depth 跳关系，返回 nodes+edges
-    - Chunk 节点：只返回部分字段 + 可选 snippet，不返回全文 text
+    变长模式的跳数不能参数化：按 (direction, depth) 缓存查询文本。
+    depth 已被钳到 GRAPH_MAX_DEPTH，组合数有限，服务端每种只编译一次计划。
     """
-    _validate_eid(req.seed_eid, "seed_eid")
-
-    depth = _clamp(req.depth, 1, settings.GRAPH_MAX_DEPTH)
-    limit_paths = _clamp(req.limit_paths, 1, settings.GRAPH_MAX_PATHS)
-    snippet_len = _clamp(req.snippet_len, 0, settings.GRAPH_MAX_SNIPPET_LEN)
-
-    if req.direction == "out":
+    if direction == "out":
         pattern = f"(seed)-[*1..{depth}]->(m)"
-    elif req.direction == "in":
+    elif direction == "in":
         pattern = f"(seed)<-[*1..{depth}]-(m)"
     else:
         pattern = f"(seed)-[*1..{depth}]-(m)"
@@ -330,6 +363,26 @@ async def get_subgraph(
 
     RETURN nodes_out AS nodes, edges_out AS edges
     """
+    return cypher
+
+
+@router.post("/subgraph", response_model=GraphResponse)
+async def get_subgraph(
+    req: SubgraphRequest,
+    driver: AsyncDriver = Depends(get_neo4j_driver),
+) -> ORJSONResponse:
+    """
+    ✅ POST /graph/subgraph
+    获取子图：从 seed_eid 出发展开 depth 跳关系，返回 nodes+edges
+    - Chunk 节点：只返回部分字段 + 可选 snippet，不返回全文 text
+    """
+    _validate_eid(req.seed_eid, "seed_eid")
+
+    depth = _clamp(req.depth, 1, settings.GRAPH_MAX_DEPTH)
+    limit_paths = _clamp(req.limit_paths, 1, settings.GRAPH_MAX_PATHS)
+    snippet_len = _clamp(req.snippet_len, 0, settings.GRAPH_MAX_SNIPPET_LEN)
+
+    cypher = _subgraph_cypher(req.direction, depth)
 
     params = {
         "seed_eid": req.seed_eid,
@@ -338,13 +391,12 @@ async def get_subgraph(
         "snippet_len": snippet_len,
     }
 
-    async with driver.session(database=settings.NEO4J_DATABASE) as session:
-        record = await (await session.run(cypher, **params)).single()
+    record = _first(await _read(driver, cypher, **params))
 
     if record is None:
-        return GraphResponse(nodes=[], edges=[])
+        return ORJSONResponse({"nodes": [], "edges": []})
 
-    return GraphResponse(nodes=record["nodes"], edges=record["edges"])
+    return ORJSONResponse({"nodes": record["nodes"], "edges": record["edges"]})
 
 
 @router.get("/chunks/by-eid/{chunk_eid}")
@@ -372,8 +424,7 @@ async def get_chunk_by_eid(
     } AS chunk
     """
 
-    async with driver.session(database=settings.NEO4J_DATABASE) as session:
-        record = await (await session.run(cypher, chunk_eid=chunk_eid)).single()
+    record = _first(await _read(driver, cypher, chunk_eid=chunk_eid))
 
     if record is None or record.get("chunk") is None:
         raise HTTPException(status_code=404, detail="Chunk not found")
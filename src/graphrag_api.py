@@ -1,61 +1,32 @@
 from __future__ import annotations
 
-import json
+import asyncio
 import uuid
 from typing import Any, AsyncGenerator
 
 from fastapi import APIRouter
-from fastapi.responses import StreamingResponse
 from .graphrag_schema import GraphRAGChatRequest
-from .graphrag_retriever import neo4j_retrieve, build_context
-from .llm_client import DeepSeekClient
+from .graphrag_retriever import build_context, lexical_keywords, merge_retrieved, neo4j_retrieve
+from .entity_batcher import entity_batcher
+from .llm_client import get_llm_client
+from .sse_utils import EV_DONE, EV_META, event_stream_response, sse, sse_token
 
 
 router = APIRouter(prefix="/graphrag", tags=["GraphRAG"])
 
-llm = DeepSeekClient()
-
-
-def sse(event: str, data: Any) -> str:
-    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+llm = get_llm_client()
 
 
 async def extract_entities_via_llm(messages: list[dict[str, str]]) -> dict[str, Any]:
     """
-    用 LLM 从最后一条 user 问句抽取实体/关键词，输出严格 JSON。
+    用 LLM 从最后一条 user 问句抽取实体/关键词（并发请求经微批合并）。
     """
     last_user = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
-
-    system = (
-        "你是信息抽取器。给定小说问句，抽取可能的实体与关键词。"
-        "只输出严格 JSON，不要输出多余文字。字段：persons, locations, orgs, events, keywords，值为字符串数组。"
-    )
-
-    resp = await llm.chat_completion_async(
-        messages=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": last_user},
-        ],
-        stream=False,
-        temperature=0.0,
-        # max_tokens 可以不传，默认走 settings.MAX_TOKENS
-    )
-
-    content = (resp["choices"][0]["message"].get("content") or "").strip()
-
-    try:
-        data = json.loads(content)
-        # 基础兜底，避免缺字段
-        return {
-            "persons": data.get("persons", []) or [],
-            "locations": data.get("locations", []) or [],
-            "orgs": data.get("orgs", []) or [],
-            "events": data.get("events", []) or [],
-            "keywords": data.get("keywords", []) or [],
-        }
-    except Exception:
+    ent = await entity_batcher.extract(last_user)
+    if ent is None:
         # 抽取失败就退化为关键词检索
         return {"persons": [], "locations": [], "orgs": [], "events": [], "keywords": [last_user]}
+    return ent
 
 
 @router.post("/chat")
@@ -69,20 +40,42 @@ async def graphrag_chat(req: GraphRAGChatRequest):
     req_id = str(uuid.uuid4())
     messages = [{"role": m.role, "content": m.content} for m in req.messages]
 
-    async def event_gen() -> AsyncGenerator[str, None]:
-        # A) 抽取实体
-        ent = await extract_entities_via_llm(messages)
-        yield sse("meta", {"id": req_id, "stage": "entity_extracted", "entities": ent})
+    last_user = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+
+    async def event_gen() -> AsyncGenerator[bytes, None]:
+        # 实体抽取（LLM）与基于原问句关键词的预检索并行
+        ent_task = asyncio.create_task(extract_entities_via_llm(messages))
+        pre_task = asyncio.create_task(
+            neo4j_retrieve(
+                {"keywords": lexical_keywords(last_user)},
+                top_k_chunks=req.top_k_chunks,
+                max_hops=req.max_hops,
+            )
+        )
+        try:
+            # A) 抽取实体
+            ent = await ent_task
+            yield sse(EV_META, {"id": req_id, "stage": "entity_extracted", "entities": ent})
+
+            # B) Neo4j 检索：实体检索为主，预检索结果补位
+            retrieved = await neo4j_retrieve(ent, top_k_chunks=req.top_k_chunks, max_hops=req.max_hops)
+            try:
+                pre_retrieved = await pre_task
+            except Exception:
+                pre_retrieved = {"edges": [], "chunks": []}
+            retrieved = merge_retrieved(retrieved, pre_retrieved, top_k_chunks=req.top_k_chunks)
+        finally:
+            for t in (ent_task, pre_task):
+                if not t.done():
+                    t.cancel()
 
-        # B) Neo4j 检索
-        retrieved = await neo4j_retrieve(ent, top_k_chunks=req.top_k_chunks, max_hops=req.max_hops)
         yield sse(
-            "meta",
+            EV_META,
             {
                 "id": req_id,
                 "stage": "retrieved",
-                "edges": len(retrieved.get("edges", [])),
-                "chunks": [c["chunk_id"] for c in retrieved.get("chunks", [])],
+                "edges": len(retrieved.get("edges", ())),
+                "chunks": list(dict.fromkeys(c["chunk_id"] for c in retrieved.get("chunks", ()))),
             },
         )
 
@@ -99,8 +92,8 @@ async def graphrag_chat(req: GraphRAGChatRequest):
             messages=augmented,
             temperature=0.2,
         ):
-            yield sse("token", {"id": req_id, "delta": token})
+            yield sse_token(req_id, token)
 
-        yield sse("done", {"id": req_id, "stage": "completed"})
+        yield sse(EV_DONE, {"id": req_id, "stage": "completed"})
 
-    return StreamingResponse(event_gen(), media_type="text/event-stream")
+    return event_stream_response(event_gen())
@@ -1,7 +1,11 @@
 from __future__ import annotations
+import re
+import time
 from typing import Any
 
-from neo4j import AsyncGraphDatabase, AsyncDriver
+from neo4j import RoutingControl
+
+from .neo4j_client import get_driver
 from .settings import settings
 
 REL_WHITELIST = [
@@ -10,103 +14,223 @@ REL_WHITELIST = [
     "HAPPENS_AT", "INVOLVES", "MENTIONED_IN", "SUPPORTED_BY",
 ]
 
-driver: AsyncDriver = AsyncGraphDatabase.driver(
-    settings.NEO4J_URI,
-    auth=(settings.NEO4J_USER, settings.NEO4J_PASSWORD),
-)
+def _clean(items: Any, limit: int) -> list[str]:
+    # 取前 limit 个，去空白/非字符串，保序去重
+    return list(dict.fromkeys(
+        n.strip() for n in (items or [])[:limit] if isinstance(n, str) and n.strip()
+    ))
 
-async def close_neo4j_driver() -> None:
-    await driver.close()
 
-async def neo4j_retrieve(entity_pack: dict[str, Any], top_k_chunks: int, max_hops: int) -> dict[str, Any]:
-    persons = (entity_pack.get("persons") or [])[:5]
-    events = (entity_pack.get("events") or [])[:5]
-    keywords = (entity_pack.get("keywords") or [])[:8]
+def _candidate_names(entity_pack: dict[str, Any]) -> list[str]:
+    """
+    所有实体类候选合成一个去重列表，交给一次 UNWIND 查询。
+    """
+    names: list[str] = []
+    for key, limit in (("persons", 5), ("locations", 5), ("orgs", 5), ("events", 5), ("keywords", 8)):
+        names += _clean(entity_pack.get(key), limit)
+    return list(dict.fromkeys(names))
 
-    fallback_keywords = list({*(persons or []), *(events or [])})
 
-    cypher = """
-    WITH $persons AS persons, $events AS events, $keywords AS keywords, $fallback_keywords AS fallback_keywords
+def _lucene_query(keywords: list[str]) -> str:
+    """
+    关键词 -> chunk_text_ft 的查询串：每个词一个短语（cjk 分词下即相邻二元组），OR 连接。
+    """
+    return " OR ".join(
+        '"' + k.replace("\\", "\\\\").replace('"', '\\"') + '"' for k in keywords
+    )
 
-    OPTIONAL MATCH (p:Person) WHERE p.name IN persons OR any(a in coalesce(p.alias, []) WHERE a IN persons)
-    OPTIONAL MATCH (e:Event)  WHERE e.name IN events  OR any(a in coalesce(e.alias, []) WHERE a IN events)
 
-    OPTIONAL MATCH (p)-[r1]->(x)
-    WHERE type(r1) IN $rel_whitelist
+# 关键词取 chunk：chunk_text_ft 可用时查全文索引，否则退回逐 chunk 的 CONTAINS（不依赖任何索引）
+_KW_FULLTEXT = """CALL {
+      UNWIND CASE WHEN $lucene_q = '' THEN [] ELSE [$lucene_q] END AS q
+      CALL db.index.fulltext.queryNodes('chunk_text_ft', q) YIELD node, score
+      WITH node ORDER BY score DESC LIMIT $top_k
+      RETURN collect(node) AS kw_chunks
+    }"""
+
+_KW_CONTAINS = """CALL {
+      MATCH (ck:Chunk)
+      WHERE size($keywords) > 0 AND any(k IN $keywords WHERE ck.text CONTAINS k)
+      WITH ck LIMIT $top_k
+      RETURN collect(ck) AS kw_chunks
+    }"""
+
+# 索引 ONLINE 后结果永久缓存；未就绪（无建索引权限 / 仍在 POPULATING）时隔一段时间再查
+_FULLTEXT_RECHECK_S = 60.0
+_fulltext_online = False
+_fulltext_checked_at: float | None = None
+
+
+async def _chunk_fulltext_online() -> bool:
+    global _fulltext_online, _fulltext_checked_at
+    now = time.monotonic()
+    if _fulltext_online or (
+        _fulltext_checked_at is not None and now - _fulltext_checked_at < _FULLTEXT_RECHECK_S
+    ):
+        return _fulltext_online
+    _fulltext_checked_at = now
+    try:
+        records, _, _ = await get_driver().execute_query(
+            "SHOW INDEXES YIELD name, state WHERE name = 'chunk_text_ft' AND state = 'ONLINE' "
+            "RETURN count(*) AS n",
+            database_=settings.NEO4J_DATABASE,
+            routing_=RoutingControl.READ,
+        )
+        _fulltext_online = bool(records and records[0]["n"])
+    except Exception:
+        _fulltext_online = False
+    return _fulltext_online
+
 
-    OPTIONAL MATCH (x)-[r2]->(y)
-    WHERE $max_hops >= 2 AND type(r2) IN $rel_whitelist
+async def neo4j_retrieve(entity_pack: dict[str, Any], top_k_chunks: int, max_hops: int) -> dict[str, Any]:
+    names = _candidate_names(entity_pack)
 
-    OPTIONAL MATCH (e)-[:SUPPORTED_BY]->(c1:Chunk)
-    OPTIONAL MATCH (x)-[:SUPPORTED_BY]->(c2:Chunk)
-    OPTIONAL MATCH (y)-[:SUPPORTED_BY]->(c3:Chunk)
+    # 关键词为空时才退回用人名/事件名查全文索引
+    text_keywords = _clean(entity_pack.get("keywords"), 8) or list(dict.fromkeys(
+        _clean(entity_pack.get("persons"), 5) + _clean(entity_pack.get("events"), 5)
+    ))
 
-    OPTIONAL MATCH (ck:Chunk)
-    WHERE (
-      (size(keywords) > 0 AND any(k IN keywords WHERE ck.text CONTAINS k))
-      OR
-      (size(keywords) = 0 AND size(fallback_keywords) > 0 AND any(k IN fallback_keywords WHERE ck.text CONTAINS k))
+    # 每段检索各自一个子查询（各自聚合成一行），行流不再互相做笛卡尔积
+    cypher = """
+    CALL {
+      UNWIND $names AS name
+      CALL {
+        WITH name MATCH (s:Person {name: name}) RETURN s
+        UNION
+        WITH name MATCH (s:Place {name: name}) RETURN s
+        UNION
+        WITH name MATCH (s:Org {name: name}) RETURN s
+      }
+      RETURN collect(DISTINCT s) AS seeds
+    }
+
+    CALL {
+      WITH seeds
+      UNWIND seeds AS p
+      MATCH (p)-[r1]->(x)
+      WHERE type(r1) IN $rel_whitelist
+      RETURN
+        collect(DISTINCT x) AS hop1,
+        collect(DISTINCT {from: coalesce(p.name,""), rel: type(r1), to: coalesce(x.name,"")}) AS edges1
+    }
+
+    CALL {
+      WITH hop1
+      UNWIND CASE WHEN $max_hops >= 2 THEN hop1 ELSE [] END AS x
+      MATCH (x)-[r2]->(y)
+      WHERE type(r2) IN $rel_whitelist
+      RETURN
+        collect(DISTINCT y) AS hop2,
+        collect(DISTINCT {from: coalesce(x.name,""), rel: type(r2), to: coalesce(y.name,"")}) AS edges2
+    }
+
+    CALL {
+      WITH hop1, hop2
+      UNWIND hop1 + hop2 AS n
+      MATCH (n)-[:SUPPORTED_BY]->(c:Chunk)
+      WITH DISTINCT c LIMIT $top_k
+      RETURN collect(c) AS graph_chunks
+    }
+
+    __KW_CHUNKS__
+
+    CALL {
+      WITH graph_chunks, kw_chunks
+      UNWIND graph_chunks + kw_chunks AS c
+      WITH DISTINCT c WHERE c.chunk_id IS NOT NULL
+      WITH c LIMIT $top_k
+      RETURN collect({chunk_id: c.chunk_id, chapter_id: c.chapter_id, text: c.text}) AS chunks
+    }
+
+    RETURN (edges1 + edges2)[0..80] AS edges, chunks
+    """
+    use_fulltext = await _chunk_fulltext_online()
+    cypher = cypher.replace("__KW_CHUNKS__", _KW_FULLTEXT if use_fulltext else _KW_CONTAINS)
+
+    records, _, _ = await get_driver().execute_query(
+        cypher,
+        parameters_={
+            "names": names,
+            "lucene_q": _lucene_query(text_keywords) if use_fulltext else "",
+            "keywords": text_keywords,
+            "top_k": top_k_chunks,
+            "max_hops": max_hops,
+            "rel_whitelist": REL_WHITELIST,
+        },
+        database_=settings.NEO4J_DATABASE,
+        routing_=RoutingControl.READ,
     )
+    row = records[0] if records else None
+
+    if not row:
+        return {"edges": [], "chunks": []}
 
-    WITH
-      collect(DISTINCT {from: coalesce(p.name,""), rel: type(r1), to: coalesce(x.name,"")}) +
-      collect(DISTINCT {from: coalesce(x.name,""), rel: type(r2), to: coalesce(y.name,"")}) AS edges,
-      collect(DISTINCT c1) + collect(DISTINCT c2) + collect(DISTINCT c3) + collect(DISTINCT ck) AS chunks
+    # 边只来自非 OPTIONAL 的 MATCH（rel 必非空），chunk 已在 Cypher 里 DISTINCT，不再二次过滤
+    return {"edges": row.get("edges") or [], "chunks": row.get("chunks") or []}
 
-    UNWIND chunks AS c
-    WITH edges, c
-    WHERE c IS NOT NULL
 
-    RETURN
-      edges[0..80] AS edges,
-      collect(DISTINCT {chunk_id: c.chunk_id, chapter_id: c.chapter_id, text: c.text})[0..$top_k] AS chunks
-    """
+_LEXICAL_SPLIT_RE = re.compile(r"[\s\W_]+")
 
-    async with driver.session(database=settings.NEO4J_DATABASE) as session:
-        res = await session.run(
-            cypher,
-            persons=persons,
-            events=events,
-            keywords=keywords,
-            fallback_keywords=fallback_keywords,
-            top_k=top_k_chunks,
-            max_hops=max_hops,
-            rel_whitelist=REL_WHITELIST,
-        )
-        row = await res.single()
 
-    if not row:
-        return {"edges": [], "chunks": []}
+def lexical_keywords(text: str, limit: int = 8) -> list[str]:
+    """
+    不依赖 LLM 的粗粒度关键词：按空白/标点切分，保留 2~12 字的片段。
+    用于实体抽取返回前的预检索。
+    """
+    out: list[str] = []
+    for tok in _LEXICAL_SPLIT_RE.split(text or ""):
+        if 2 <= len(tok) <= 12 and tok not in out:
+            out.append(tok)
+            if len(out) >= limit:
+                break
+    return out
 
-    edges = [e for e in (row.get("edges") or []) if e.get("rel")]
-    chunks = row.get("chunks") or []
 
-    seen = set()
-    dedup = []
-    for c in chunks:
+def merge_retrieved(primary: dict[str, Any], extra: dict[str, Any], top_k_chunks: int) -> dict[str, Any]:
+    """
+    合并两次检索结果：primary 优先，边按 (from, rel, to) 去重，chunk 按 chunk_id 去重。
+    """
+    edges = list(primary.get("edges") or [])
+    seen_edges = {(e.get("from"), e.get("rel"), e.get("to")) for e in edges}
+    for e in extra.get("edges") or []:
+        key = (e.get("from"), e.get("rel"), e.get("to"))
+        if key not in seen_edges:
+            seen_edges.add(key)
+            edges.append(e)
+
+    chunks: list[dict[str, Any]] = []
+    seen_chunks = set()
+    for c in [*(primary.get("chunks") or []), *(extra.get("chunks") or [])]:
         cid = c.get("chunk_id")
-        if not cid or cid in seen:
+        if not cid or cid in seen_chunks:
             continue
-        seen.add(cid)
-        dedup.append(c)
+        seen_chunks.add(cid)
+        chunks.append(c)
+        if len(chunks) >= top_k_chunks:
+            break
+
+    return {"edges": edges[:80], "chunks": chunks}
 
-    return {"edges": edges, "chunks": dedup}
 
 def build_context(retrieved: dict[str, Any]) -> str:
+    """
+    事实按 (from, rel, to)、证据按 chunk_id 排序后再渲染：同一检索集合得到逐字节相同的上下文，
+    利于 LLM 侧的前缀缓存。
+    """
     edges = retrieved.get("edges", []) or []
     chunks = retrieved.get("chunks", []) or []
 
-    fact_lines = []
-    for e in edges[:80]:
-        frm, rel, to = e.get("from"), e.get("rel"), e.get("to")
-        if frm and rel and to:
-            fact_lines.append(f"- ({frm}) -[{rel}]-> ({to})")
-
-    chunk_blocks = []
-    for c in chunks:
-        chunk_blocks.append(
-            f"[chunk_id={c.get('chunk_id','')}, chapter_id={c.get('chapter_id','')}] {c.get('text','')}"
-        )
+    facts = sorted({
+        (e.get("from"), e.get("rel"), e.get("to"))
+        for e in edges[:80]
+        if e.get("from") and e.get("rel") and e.get("to")
+    })
+    blocks = sorted(
+        (str(c.get("chunk_id", "")), str(c.get("chapter_id", "")), str(c.get("text", "")))
+        for c in chunks
+    )
+    fact_lines = [f"- ({frm}) -[{rel}]-> ({to})" for frm, rel, to in facts]
+    chunk_blocks = [f"[chunk_id={cid}, chapter_id={chap}] {text}" for cid, chap, text in blocks]
 
     return (
         "你将基于“子图事实”和“证据片段”回答用户问题。不得编造；若证据不足就说明不足。\n\n"
@@ -1,39 +1,179 @@
 from __future__ import annotations
 
-import json
+import mmap
+import os
+import time
 from pathlib import Path
-from typing import Any, Dict, Iterable, Set
+from typing import Any, BinaryIO, Dict, Iterable, List, Optional, Set
+
+import orjson
 
 
 def read_jsonl(path: Path) -> Iterable[Dict[str, Any]]:
-    with path.open("r", encoding="utf-8") as f:
+    # 二进制读 + orjson：省掉逐行 UTF-8 解码
+    with path.open("rb") as f:
         for line in f:
             line = line.strip()
             if not line:
                 continue
-            yield json.loads(line)
+            yield orjson.loads(line)
+
+
+def read_jsonl_all(path: Path) -> List[Dict[str, Any]]:
+    """
+    整文件一次性解析（mmap + 按行切分），适合需要全量建索引的场景。
+    """
+    with path.open("rb") as f:
+        if path.stat().st_size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            data = mm[:]
+    return [orjson.loads(line) for line in data.split(b"\n") if line.strip()]
+
+
+def read_jsonl_buffered(path: Path) -> Iterable[Dict[str, Any]]:
+    """
+    一次 read() 读入整个文件，再按行惰性解析：省掉逐行读的系统调用，
+    内存里只多一份原始字节，解析出的对象边产出边释放。
+    """
+    with path.open("rb") as f:
+        buf = f.read()
+    for line in buf.split(b"\n"):
+        if line.strip():
+            yield orjson.loads(line)
+
+
+_JSONL_OPTS = orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE
 
 
 def append_jsonl(path: Path, obj: Dict[str, Any]) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
-    with path.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(obj, ensure_ascii=False) + "\n")
+    with path.open("ab") as f:
+        f.write(orjson.dumps(obj, option=_JSONL_OPTS))
+
+
+def _done_index_path(path: Path, id_field: str) -> Path:
+    return path.with_name(f"{path.name}.{id_field}.idx")
+
+
+class JsonlSink:
+    """
+    长驻的 JSONL 追加写：整个脚本只 open 一次，行先攒进内存缓冲，
+    满 flush_bytes 或距上次落盘超过 flush_interval 秒才 write；关闭时 fsync。
+    给了 id_field 时同步维护旁路索引（每行 "<写完该行后的文件字节数>\t<id>"），
+    供 load_done_ids 免解析恢复；索引总是在数据之后落盘，只可能落后、不会超前。
+    崩溃丢掉的尾部由 load_done_ids + --resume 补跑。
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        id_field: Optional[str] = None,
+        flush_bytes: int = 64 * 1024,
+        flush_interval: float = 5.0,
+    ) -> None:
+        self.path = path
+        self.id_field = id_field
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self._f: Optional[BinaryIO] = None
+        self._idx: Optional[BinaryIO] = None
+        self._buf = bytearray()
+        self._idx_buf = bytearray()
+        self._offset = 0
+        self._last_flush = 0.0
+
+    def __enter__(self) -> "JsonlSink":
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._f = self.path.open("ab")
+        self._offset = self._f.tell()
+        # 上次中断可能留下半行：补一个换行，避免和新行粘在一起
+        if self._offset > 0:
+            with self.path.open("rb") as r:
+                r.seek(-1, os.SEEK_END)
+                if r.read(1) != b"\n":
+                    self._buf += b"\n"
+                    self._offset += 1
+        if self.id_field:
+            # 数据文件是新的/空的：旧索引（文件被删或替换后残留）一律作废，截断重建
+            self._idx = _done_index_path(self.path, self.id_field).open("ab" if self._offset > 0 else "wb")
+        self._last_flush = time.monotonic()
+        return self
+
+    def write(self, obj: Dict[str, Any]) -> None:
+        line = orjson.dumps(obj, option=_JSONL_OPTS)
+        self._buf += line
+        self._offset += len(line)
+        if self._idx is not None:
+            cid = obj.get(self.id_field)
+            if isinstance(cid, str) and cid:
+                self._idx_buf += f"{self._offset}\t{cid}\n".encode()
+        if len(self._buf) >= self.flush_bytes or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        assert self._f is not None
+        if self._buf:
+            self._f.write(self._buf)
+            self._f.flush()
+            self._buf.clear()
+        if self._idx is not None and self._idx_buf:
+            self._idx.write(self._idx_buf)
+            self._idx.flush()
+            self._idx_buf.clear()
+        self._last_flush = time.monotonic()
+
+    def __exit__(self, *exc: Any) -> None:
+        if self._f is None:
+            return
+        self.flush()
+        os.fsync(self._f.fileno())
+        self._f.close()
+        self._f = None
+        if self._idx is not None:
+            self._idx.close()
+            self._idx = None
+
+
+def _scan_ids(lines: Iterable[bytes], id_field: str, done: Set[str]) -> None:
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            cid = orjson.loads(line).get(id_field)
+        except Exception:
+            continue
+        if isinstance(cid, str) and cid:
+            done.add(cid)
 
 
 def load_done_ids(out_path: Path, id_field: str = "chunk_id") -> Set[str]:
+    """
+    优先读旁路索引，只解析索引之后新增的尾部；索引缺失或与数据对不上（文件被截断/替换）时全量解析。
+    """
     if not out_path.exists():
         return set()
     done: Set[str] = set()
-    with out_path.open("r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                obj = json.loads(line)
-                cid = obj.get(id_field)
-                if isinstance(cid, str) and cid:
-                    done.add(cid)
-            except Exception:
+    size = out_path.stat().st_size
+
+    covered = 0
+    idx_path = _done_index_path(out_path, id_field)
+    if idx_path.exists():
+        for line in idx_path.read_bytes().split(b"\n"):
+            off, sep, cid = line.partition(b"\t")
+            if not sep or not cid or not off.isdigit():
                 continue
+            pos = int(off)
+            # 偏移超出数据文件或不单调递增：索引不属于当前数据文件，整份丢弃
+            if pos > size or pos < covered:
+                done.clear()
+                covered = 0
+                break
+            done.add(cid.decode())
+            covered = pos
+
+    with out_path.open("rb") as f:
+        f.seek(covered)
+        _scan_ids(f, id_field, done)
     return done
@@ -1,21 +1,73 @@
 from __future__ import annotations
 
-from datetime import datetime, timedelta, timezone
-from typing import Any
-from jose import jwt, JWTError
+import base64
+import hashlib
+import hmac
+import time
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any
+import jwt
+import orjson
+from jwt.exceptions import InvalidTokenError
 
 from .auth_security import new_urlsafe_token
+from .cache import TTLCache
 from .settings import settings
 
+if TYPE_CHECKING:
+    from .auth_store import UserView
+    from .models import User
 
-def _now() -> datetime:
-    return datetime.now(timezone.utc)
 
+# 已验签的 payload：key 用 token 摘要（不存原 token），TTL 不超过 token 剩余有效期；失败不缓存
+_DECODED_TTL_S = 60
+_decoded = TTLCache(maxsize=10_000, ttl=_DECODED_TTL_S)
 
-def create_access_token(user_id: str) -> str:
-    exp = _now() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    payload = {"sub": user_id, "type": "access", "exp": exp}
-    return jwt.encode(payload, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALG)
+# 校验配置只建一次：共享解码器 + 固定的算法元组 / options
+_ALGS = (settings.JWT_ALG,)
+_LEEWAY_S = 5
+_OPTIONS = {"verify_signature": True, "verify_exp": True, "require": ["exp", "sub", "type"]}
+_OPTIONS_JTI = {**_OPTIONS, "require": ["exp", "sub", "type", "jti"]}
+_decoder = jwt.PyJWT()
+
+
+def _b64url(raw: bytes) -> bytes:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=")
+
+
+# HS* 签名：header 固定、密钥固定，导入时预先算好 header 段和已载入密钥的 HMAC，每次签发只 copy
+_HS_DIGESTS = {"HS256": hashlib.sha256, "HS384": hashlib.sha384, "HS512": hashlib.sha512}
+_HEADER_B64 = _b64url(orjson.dumps({"alg": settings.JWT_ALG, "typ": "JWT"}))
+_hmac_template = (
+    hmac.new(settings.JWT_SECRET_KEY.encode(), None, _HS_DIGESTS[settings.JWT_ALG])
+    if settings.JWT_ALG in _HS_DIGESTS
+    else None
+)
+
+
+def _encode(payload: dict[str, Any]) -> str:
+    if _hmac_template is None:
+        return jwt.encode(payload, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALG)
+    signing_input = _HEADER_B64 + b"." + _b64url(orjson.dumps(payload))
+    h = _hmac_template.copy()
+    h.update(signing_input)
+    return (signing_input + b"." + _b64url(h.digest())).decode()
+
+
+def create_access_token(user: User | UserView) -> str:
+    """
+    access token 里带上展示用的用户字段，鉴权时可直接由 payload 还原用户，免查库。
+    """
+    payload = {
+        "sub": user.id,
+        "type": "access",
+        "exp": int(time.time()) + settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        "email": user.email,
+        "nick": user.nickname,
+        "avatar": user.avatar_url,
+        "ver": user.is_verified,
+    }
+    return _encode(payload)
 
 
 def create_refresh_token(user_id: str) -> tuple[str, str, datetime]:
@@ -23,14 +75,38 @@ def create_refresh_token(user_id: str) -> tuple[str, str, datetime]:
     返回 (refresh_jwt, jti, expires_at)
     """
     jti = new_urlsafe_token(24)
-    exp = _now() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
-    payload = {"sub": user_id, "type": "refresh", "jti": jti, "exp": exp}
-    token = jwt.encode(payload, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALG)
-    return token, jti, exp
+    exp_ts = int(time.time()) + settings.REFRESH_TOKEN_EXPIRE_DAYS * 86400
+    payload = {"sub": user_id, "type": "refresh", "jti": jti, "exp": exp_ts}
+    token = _encode(payload)
+    # expires_at 要落库，这里才转一次 datetime
+    return token, jti, datetime.fromtimestamp(exp_ts, timezone.utc)
 
 
-def decode_token(token: str) -> dict[str, Any]:
+def decode_token(token: str, require_jti: bool = False) -> dict[str, Any]:
+    """
+    校验失败统一抛 ValueError。
+    结构明显不对（不是 header.payload.signature）的直接拒绝，不走签名校验。
+    """
+    if token.count(".") != 2:
+        raise ValueError("Invalid token")
+
+    key = (hashlib.blake2b(token.encode(), digest_size=20).digest(), require_jti)
+    payload = _decoded.get(key)
+    if payload is not None:
+        return payload
+
     try:
-        return jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALG])
-    except JWTError as e:
+        payload = _decoder.decode(
+            token,
+            settings.JWT_SECRET_KEY,
+            algorithms=_ALGS,
+            options=_OPTIONS_JTI if require_jti else _OPTIONS,
+            leeway=_LEEWAY_S,
+        )
+    except InvalidTokenError as e:
         raise ValueError("Invalid token") from e
+
+    remaining = payload["exp"] - time.time()
+    if remaining > 0:
+        _decoded.set(key, payload, ttl=min(_DECODED_TTL_S, remaining))
+    return payload
@@ -1,40 +1,226 @@
 from __future__ import annotations
 
-import json
+import asyncio
+import hashlib
+import os
+import random
 import re
 import time
+import warnings
+from functools import lru_cache
+from pathlib import Path
 from typing import Any, Dict, Optional, AsyncGenerator
 
 import httpx
-from openai import OpenAI
+import orjson
+from openai import AsyncOpenAI, DefaultAioHttpClient, OpenAI
 
 from .settings import settings
 
 
-_JSON_OBJ_RE = re.compile(r"\{.*\}", re.S)
+_JSON_SPECIAL_RE = re.compile(r'[{}"\\]')
+
+
+def _find_json_span(text: str) -> Optional[tuple[int, int]]:
+    """
+    单遍扫描：从第一个 { 起按深度找到与之配对的 }，字符串字面量内的括号/转义不计。
+    只在结构字符上停（finditer 在 C 里跳过普通字符），最坏 O(n)，无回溯。
+    """
+    start = text.find("{")
+    if start < 0:
+        return None
+    depth = 0
+    in_str = False
+    escaped_at = -1
+    for m in _JSON_SPECIAL_RE.finditer(text, start):
+        i = m.start()
+        if i == escaped_at:
+            continue
+        ch = m.group()
+        if in_str:
+            if ch == "\\":
+                escaped_at = i + 1
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            in_str = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return start, i + 1
+    return None
 
 
 def _extract_json_object(text: str) -> Dict[str, Any]:
     text = (text or "").strip()
-    try:
-        return json.loads(text)
-    except Exception:
-        pass
-    m = _JSON_OBJ_RE.search(text)
-    if not m:
+    # 只有整段看起来就是一个对象时才直接解析；夹在说明文字里的直接走扫描，省一次抛异常
+    if text.startswith("{") and text.endswith("}"):
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            pass
+    span = _find_json_span(text)
+    if span is None:
         raise ValueError(f"Model response is not JSON. head={text[:200]!r}")
-    return json.loads(m.group(0))
+    return orjson.loads(text[span[0]:span[1]])
+
+
+_CONTENT_KEY = b'"content":"'
+_DATA_PREFIX = b"data:"
+_DONE = b"[DONE]"
+
+
+def _delta_content(data: bytes) -> Optional[str]:
+    """
+    从一条流式 chunk 里取 choices[0].delta.content。
+    快速路径：直接定位 "content":"...，字面量里没有转义就原样切片；
+    有转义、或不是这种形状（null / 其它字段顺序）时退回 orjson 整条解析。
+    """
+    i = data.find(_CONTENT_KEY)
+    if i >= 0:
+        start = i + len(_CONTENT_KEY)
+        end = data.find(b'"', start)
+        if end >= 0 and b"\\" not in data[start:end]:
+            return data[start:end].decode()
+    obj = orjson.loads(data)
+    return obj["choices"][0].get("delta", {}).get("content")
+
+
+def _backoff_s(attempt: int) -> float:
+    # 指数退避 + 抖动，避免并发请求同一时刻一起重试
+    return settings.RETRY_BACKOFF_S * 2 ** (attempt - 1) * (0.5 + random.random())
 
 
 class DeepSeekClient:
     def __init__(self) -> None:
-        self.client = OpenAI(
-            api_key=settings.LLM_API_KEY,
-            base_url=settings.LLM_BASE_URL,
-            timeout=settings.TIMEOUT_S,
-        )
+        self._client: Optional[OpenAI] = None
+        self._aclient: Optional[AsyncOpenAI] = None
+        self._http: Optional[httpx.AsyncClient] = None
+        # 限制在途请求数：突发流量下排队，而不是不断新开连接撞上游限流
+        self._sem = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        # 复用一个 keep-alive（HTTP/2）连接池，避免每次调用都重新握手 TLS
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(
+                base_url=settings.LLM_BASE_URL,
+                http2=True,
+                timeout=settings.TIMEOUT_S,
+                headers={"Authorization": f"Bearer {settings.LLM_API_KEY}"},
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=32, keepalive_expiry=300),
+            )
+        return self._http
+
+    async def aclose(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+        if self._aclient is not None:
+            await self._aclient.close()
+            self._aclient = None
+
+    @property
+    def client(self) -> OpenAI:
+        # 同步客户端只给 CLI 路径用，API 进程里不会创建
+        if self._client is None:
+            self._client = OpenAI(
+                api_key=settings.LLM_API_KEY,
+                base_url=settings.LLM_BASE_URL,
+                timeout=settings.TIMEOUT_S,
+            )
+        return self._client
+
+    @property
+    def aclient(self) -> AsyncOpenAI:
+        if self._aclient is None:
+            # aiohttp 传输：高并发下尾延迟明显好于默认的 httpx 传输
+            self._aclient = AsyncOpenAI(
+                api_key=settings.LLM_API_KEY,
+                base_url=settings.LLM_BASE_URL,
+                timeout=settings.TIMEOUT_S,
+                http_client=DefaultAioHttpClient(),
+            )
+        return self._aclient
+
+    @staticmethod
+    def _cache_path(system: str, user: str) -> Optional[Path]:
+        if not settings.LLM_CACHE_DIR:
+            return None
+        h = hashlib.sha1(f"{settings.LLM_MODEL}\0{system}\0{user}".encode("utf-8")).hexdigest()
+        return Path(settings.LLM_CACHE_DIR) / h[:2] / f"{h}.json"
+
+    @staticmethod
+    def _cache_load(cache_path: Optional[Path]) -> Optional[Dict[str, Any]]:
+        if cache_path is not None and cache_path.exists():
+            return orjson.loads(cache_path.read_bytes())
+        return None
+
+    @staticmethod
+    def _cache_store(cache_path: Optional[Path], obj: Dict[str, Any]) -> None:
+        if cache_path is None:
+            return
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache_path.with_suffix(".tmp")
+        tmp.write_bytes(orjson.dumps(obj))
+        os.replace(tmp, cache_path)
 
     def chat_json(self, system: str, user: str) -> Dict[str, Any]:
+        """
+        配置了 LLM_CACHE_DIR 时按 sha1(model+system+user) 读写磁盘缓存，重跑脚本不再重复调用。
+        阻塞调用（含 time.sleep 重试），只用于 CLI；异步代码请用 chat_json_async。
+        """
+        warnings.warn(
+            "DeepSeekClient.chat_json is blocking; use chat_json_async",
+            DeprecationWarning,
+            stacklevel=2,
+        )
+        cache_path = self._cache_path(system, user)
+        cached = self._cache_load(cache_path)
+        if cached is not None:
+            return cached
+
+        obj = self._chat_json_uncached(system, user)
+        self._cache_store(cache_path, obj)
+        return obj
+
+    async def chat_json_async(self, system: str, user: str, max_tokens: int | None = None) -> Dict[str, Any]:
+        """
+        chat_json 的异步版本（同一份磁盘缓存），供离线脚本并发调用。
+        max_tokens 默认 settings.MAX_TOKENS（按单个 chunk 估的）；批量调用按块数放大。
+        """
+        cache_path = self._cache_path(system, user)
+        cached = self._cache_load(cache_path)
+        if cached is not None:
+            return cached
+
+        last_err: Optional[Exception] = None
+        for attempt in range(1, settings.MAX_RETRIES + 1):
+            try:
+                resp = await self.aclient.chat.completions.create(
+                    model=settings.LLM_MODEL,
+                    messages=[
+                        {"role": "system", "content": system},
+                        {"role": "user", "content": user},
+                    ],
+                    temperature=settings.TEMPERATURE,
+                    max_tokens=settings.MAX_TOKENS if max_tokens is None else max_tokens,
+                    stream=False,
+                )
+                obj = _extract_json_object(resp.choices[0].message.content or "")
+                break
+            except Exception as e:
+                last_err = e
+                await asyncio.sleep(_backoff_s(attempt))
+        else:
+            raise RuntimeError(f"DeepSeek call failed after retries. last_err={last_err}") from last_err
+
+        self._cache_store(cache_path, obj)
+        return obj
+
+    def _chat_json_uncached(self, system: str, user: str) -> Dict[str, Any]:
         last_err: Optional[Exception] = None
         for attempt in range(1, settings.MAX_RETRIES + 1):
             try:
@@ -52,7 +238,7 @@ class DeepSeekClient:
                 return _extract_json_object(content)
             except Exception as e:
                 last_err = e
-                time.sleep(settings.RETRY_BACKOFF_S * attempt)
+                time.sleep(_backoff_s(attempt))
         raise RuntimeError(f"DeepSeek call failed after retries. last_err={last_err}") from last_err
 
     async def chat_completion_async(
@@ -70,14 +256,10 @@ class DeepSeekClient:
             "temperature": settings.TEMPERATURE if temperature is None else temperature,
             "max_tokens": settings.MAX_TOKENS if max_tokens is None else max_tokens,
         }
-        async with httpx.AsyncClient(base_url=settings.LLM_BASE_URL, timeout=settings.TIMEOUT_S) as client:
-            r = await client.post(
-                "/chat/completions",
-                headers={"Authorization": f"Bearer {settings.LLM_API_KEY}"},
-                json=payload,
-            )
-            r.raise_for_status()
-            return r.json()
+        async with self._sem:
+            r = await self.http.post("/chat/completions", json=payload)
+        r.raise_for_status()
+        return orjson.loads(r.content)
 
     async def chat_completion_stream(
         self,
@@ -93,25 +275,32 @@ class DeepSeekClient:
             "temperature": settings.TEMPERATURE if temperature is None else temperature,
             "max_tokens": settings.MAX_TOKENS if max_tokens is None else max_tokens,
         }
-        async with httpx.AsyncClient(base_url=settings.LLM_BASE_URL, timeout=None) as client:
-            async with client.stream(
-                "POST",
-                "/chat/completions",
-                headers={"Authorization": f"Bearer {settings.LLM_API_KEY}"},
-                json=payload,
-            ) as r:
-                r.raise_for_status()
-                async for line in r.aiter_lines():
-                    if not line or not line.startswith("data:"):
+        async with self._sem, self.http.stream(
+            "POST", "/chat/completions", json=payload, timeout=None
+        ) as r:
+            r.raise_for_status()
+            # 直接在字节上按行切 SSE，不走 aiter_lines 的逐行解码
+            buf = b""
+            async for chunk in r.aiter_bytes():
+                buf += chunk
+                start = 0
+                while (nl := buf.find(b"\n", start)) >= 0:
+                    line, start = buf[start:nl], nl + 1
+                    if not line.startswith(_DATA_PREFIX):
                         continue
-                    data = line[len("data:") :].strip()
-                    if data == "[DONE]":
-                        break
+                    data = line[len(_DATA_PREFIX) :].strip()
+                    if data == _DONE:
+                        return
                     try:
-                        obj = json.loads(data)
-                        delta = obj["choices"][0].get("delta", {})
-                        token = delta.get("content")
-                        if token:
-                            yield token
+                        token = _delta_content(data)
                     except Exception:
                         continue
+                    if token:
+                        yield token
+                buf = buf[start:]
+
+
+@lru_cache(maxsize=1)
+def get_llm_client() -> DeepSeekClient:
+    # 进程内共享一个客户端（及其连接池），各路由模块都从这里取
+    return DeepSeekClient()
@@ -1,17 +1,46 @@
 from __future__ import annotations
 
-from fastapi import FastAPI
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
-from .db import init_db
+from .db import SessionLocal, init_db, warm_pool
+from .auth_store import load_revoked_jtis
 from .auth_api import router as auth_router
 from .conversation_api import router as conversation_router
-from .graphrag_retriever import close_neo4j_driver
-from .neo4j_client import init_neo4j_driver, close_neo4j_driver
+from .neo4j_client import init_neo4j_driver, close_neo4j_driver, ensure_neo4j_schema, ping_neo4j
+from .llm_client import get_llm_client
+from .emailer import close_smtp
 from .graph_router import router as graph_router
 
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncIterator[None]:
+    await init_db()
+    await warm_pool()
+    async with SessionLocal() as db:
+        await load_revoked_jtis(db)
+    await init_neo4j_driver()
+    try:
+        await ensure_neo4j_schema()
+    except Exception as e:
+        # Neo4j 不可达或账号无建索引权限：不拦启动，只有图相关接口会失败（neo4j_writer 导入时也会建）
+        logger.warning("neo4j schema setup skipped: %s", e)
+    try:
+        yield
+    finally:
+        await close_neo4j_driver()
+        await get_llm_client().aclose()
+        await close_smtp()
+
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
 
 # CORS: allow frontend (e.g. Nuxt at localhost:3000) to call the API.
 app.add_middleware(
@@ -24,22 +53,14 @@ app.add_middleware(
 
 app.include_router(auth_router)
 app.include_router(conversation_router)
-
 app.include_router(graph_router)
 
-@app.on_event("startup")
-async def _startup():
-    await init_neo4j_driver()
-
-@app.on_event("shutdown")
-async def _shutdown():
-    await close_neo4j_driver()
 
+@app.get("/health/neo4j")
+async def health_neo4j():
+    try:
+        await ping_neo4j()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"neo4j unavailable: {e}")
+    return {"status": "ok"}
 
-@app.on_event("startup")
-async def _startup():
-    await init_db()
-
-@app.on_event("shutdown")
-async def _shutdown():
-    await close_neo4j_driver()
@@ -1,10 +1,13 @@
 from __future__ import annotations
 
 from datetime import datetime, timezone
-from sqlalchemy import Boolean, DateTime, ForeignKey, String, Text
+from typing import Any
+
+from sqlalchemy import JSON, Boolean, DateTime, ForeignKey, Index, LargeBinary, String, Text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
-from .db import Base
+from .db import GUID, Base
 
 
 def utcnow() -> datetime:
@@ -14,7 +17,7 @@ def utcnow() -> datetime:
 class User(Base):
     __tablename__ = "users"
 
-    id: Mapped[str] = mapped_column(String(32), primary_key=True)  # uuid hex
+    id: Mapped[str] = mapped_column(GUID, primary_key=True)  # uuid hex
     email: Mapped[str] = mapped_column(String(320), unique=True, index=True)
     password_hash: Mapped[str] = mapped_column(Text)
     is_verified: Mapped[bool] = mapped_column(Boolean, default=False)
@@ -28,10 +31,10 @@ class User(Base):
 class EmailVerificationToken(Base):
     __tablename__ = "email_verification_tokens"
 
-    id: Mapped[str] = mapped_column(String(32), primary_key=True)
-    user_id: Mapped[str] = mapped_column(String(32), ForeignKey("users.id"), index=True)
+    id: Mapped[str] = mapped_column(GUID, primary_key=True)
+    user_id: Mapped[str] = mapped_column(GUID, ForeignKey("users.id"), index=True)
 
-    token_hash: Mapped[str] = mapped_column(String(64), index=True)  # sha256 hex
+    token_hash: Mapped[bytes] = mapped_column(LargeBinary(20), unique=True, index=True)  # blake2b-160
     expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
     used_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), default=None)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow)
@@ -43,10 +46,10 @@ class RefreshToken(Base):
     """
     __tablename__ = "refresh_tokens"
 
-    id: Mapped[str] = mapped_column(String(32), primary_key=True)
-    user_id: Mapped[str] = mapped_column(String(32), ForeignKey("users.id"), index=True)
+    id: Mapped[str] = mapped_column(GUID, primary_key=True)
+    user_id: Mapped[str] = mapped_column(GUID, ForeignKey("users.id"), index=True)
 
-    jti_hash: Mapped[str] = mapped_column(String(64), unique=True, index=True)  # sha256(jti)
+    jti_hash: Mapped[bytes] = mapped_column(LargeBinary(20), unique=True, index=True)  # blake2b-160(jti)
     expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
     revoked_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), default=None)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow)
@@ -55,27 +58,35 @@ class RefreshToken(Base):
 class Conversation(Base):
     __tablename__ = "conversations"
 
-    id: Mapped[str] = mapped_column(String(32), primary_key=True)
-    user_id: Mapped[str] = mapped_column(String(32), ForeignKey("users.id"), index=True)
+    id: Mapped[str] = mapped_column(GUID, primary_key=True)
+    user_id: Mapped[str] = mapped_column(GUID, ForeignKey("users.id"), index=True)
 
     title: Mapped[str] = mapped_column(String(200), default="New chat")
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow)
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow)
 
     user: Mapped["User"] = relationship(back_populates="conversations")
-    messages: Mapped[list["Message"]] = relationship(back_populates="conversation", cascade="all, delete-orphan")
+    # 列表接口不需要消息；真要加载时显式 options(selectinload(Conversation.messages))
+    messages: Mapped[list["Message"]] = relationship(
+        back_populates="conversation",
+        cascade="all, delete-orphan",
+        lazy="raise",
+    )
 
 
 class Message(Base):
     __tablename__ = "messages"
+    # 按会话取消息并按时间排序：复合索引直接满足 WHERE + ORDER BY（正/倒序都可扫描）
+    __table_args__ = (Index("ix_msg_conv_created", "conversation_id", "created_at"),)
 
-    id: Mapped[str] = mapped_column(String(32), primary_key=True)
-    conversation_id: Mapped[str] = mapped_column(String(32), ForeignKey("conversations.id"), index=True)
+    id: Mapped[str] = mapped_column(GUID, primary_key=True)
+    conversation_id: Mapped[str] = mapped_column(GUID, ForeignKey("conversations.id"))
 
     role: Mapped[str] = mapped_column(String(16))  # system/user/assistant
     content: Mapped[str] = mapped_column(Text, default="")
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow)
 
-    meta_json: Mapped[str] = mapped_column(Text, default="{}")
+    # JSON 列：驱动层负责编解码（SQLite 下仍存为 TEXT，旧数据无需迁移；Postgres 用 JSONB，可建 GIN 索引）
+    meta_json: Mapped[dict[str, Any]] = mapped_column(JSON().with_variant(JSONB, "postgresql"), default=dict)
 
     conversation: Mapped["Conversation"] = relationship(back_populates="messages")
@@ -1,23 +1,55 @@
 from __future__ import annotations
 
-from typing import AsyncIterator
+import asyncio
 
 from neo4j import AsyncDriver, AsyncGraphDatabase
 
+from .neo4j_schema import SCHEMA_STATEMENTS
 from .settings import settings
 
 _driver: AsyncDriver | None = None
+_init_lock = asyncio.Lock()
 
 
 async def init_neo4j_driver() -> None:
+    """
+    启动时调用一次；加锁防止并发初始化建出两个 driver。
+    """
     global _driver
-    if _driver is None:
+    async with _init_lock:
+        if _driver is not None:
+            return
+        # 进程内唯一的 driver：API 路由与 GraphRAG 检索共用同一个连接池
         _driver = AsyncGraphDatabase.driver(
             settings.NEO4J_URI,
             auth=(settings.NEO4J_USER, settings.NEO4J_PASSWORD),
+            max_connection_pool_size=settings.NEO4J_MAX_POOL_SIZE,
+            connection_acquisition_timeout=settings.NEO4J_ACQUISITION_TIMEOUT_S,
+            max_connection_lifetime=settings.NEO4J_MAX_CONN_LIFETIME_S,
+            liveness_check_timeout=settings.NEO4J_LIVENESS_CHECK_S,
+            keep_alive=True,
         )
 
 
+async def ensure_neo4j_schema() -> None:
+    """
+    启动时确保约束/索引存在（IF NOT EXISTS，可重复执行）。
+    """
+    async with get_driver().session(database=settings.NEO4J_DATABASE) as session:
+        for stmt in SCHEMA_STATEMENTS:
+            res = await session.run(stmt)
+            await res.consume()
+
+
+async def ping_neo4j() -> None:
+    """
+    RETURN 1：健康检查，顺带让连接池保持热连接。
+    """
+    async with get_driver().session(database=settings.NEO4J_DATABASE) as session:
+        res = await session.run("RETURN 1")
+        await res.consume()
+
+
 async def close_neo4j_driver() -> None:
     global _driver
     if _driver is not None:
@@ -25,8 +57,12 @@ async def close_neo4j_driver() -> None:
         _driver = None
 
 
-async def get_neo4j_driver() -> AsyncIterator[AsyncDriver]:
+def get_driver() -> AsyncDriver:
     if _driver is None:
-        await init_neo4j_driver()
-    assert _driver is not None
-    yield _driver
+        raise RuntimeError("Neo4j driver is not initialized")
+    return _driver
+
+
+async def get_neo4j_driver() -> AsyncDriver:
+    # 路由依赖：driver 已在启动时建好，这里只读全局变量
+    return get_driver()
@@ -0,0 +1,35 @@
+"""
+Neo4j 约束/索引 DDL：neo4j_writer（脚本方式运行）与 API 启动时的 ensure_neo4j_schema 共用这一份。
+不依赖其他模块，两边都能直接 import。
+"""
+from __future__ import annotations
+
+CONSTRAINTS = [
+    "CREATE CONSTRAINT book_title IF NOT EXISTS FOR (b:Book) REQUIRE b.title IS UNIQUE",
+    "CREATE CONSTRAINT chapter_id IF NOT EXISTS FOR (c:Chapter) REQUIRE c.chapter_id IS UNIQUE",
+    "CREATE CONSTRAINT chunk_id IF NOT EXISTS FOR (c:Chunk) REQUIRE c.chunk_id IS UNIQUE",
+    "CREATE CONSTRAINT person_name IF NOT EXISTS FOR (p:Person) REQUIRE p.name IS UNIQUE",
+    "CREATE CONSTRAINT place_name IF NOT EXISTS FOR (p:Place) REQUIRE p.name IS UNIQUE",
+    "CREATE CONSTRAINT org_name IF NOT EXISTS FOR (o:Org) REQUIRE o.name IS UNIQUE",
+    "CREATE CONSTRAINT event_id IF NOT EXISTS FOR (e:Event) REQUIRE e.event_id IS UNIQUE",
+    # 新增：Participant 唯一键
+    "CREATE CONSTRAINT participant_key IF NOT EXISTS FOR (p:Participant) REQUIRE p.key IS UNIQUE",
+]
+
+
+# 列表页用：score 排序（预计算的提及次数）+ 名称 CONTAINS 搜索（TEXT 索引）；另有按 chunk / 章节 / 泛称过滤用的普通索引
+INDEXES = [
+    "CREATE INDEX person_mention_count IF NOT EXISTS FOR (p:Person) ON (p.mention_count)",
+    "CREATE INDEX event_mention_count IF NOT EXISTS FOR (e:Event) ON (e.mention_count)",
+    "CREATE INDEX person_first_seen IF NOT EXISTS FOR (p:Person) ON (p.first_seen_chapter, p.first_seen_chunk, p.name)",
+    "CREATE INDEX event_first_seen IF NOT EXISTS FOR (e:Event) ON (e.first_seen_chapter, e.first_seen_chunk)",
+    "CREATE INDEX event_chunk IF NOT EXISTS FOR (e:Event) ON (e.chunk_id)",
+    "CREATE INDEX chunk_chapter IF NOT EXISTS FOR (c:Chunk) ON (c.chapter_id)",
+    "CREATE INDEX person_generic IF NOT EXISTS FOR (p:Person) ON (p.is_generic)",
+    "CREATE TEXT INDEX person_name_text IF NOT EXISTS FOR (p:Person) ON (p.name)",
+    "CREATE TEXT INDEX event_summary_text IF NOT EXISTS FOR (e:Event) ON (e.summary)",
+    "CREATE FULLTEXT INDEX chunk_text_ft IF NOT EXISTS FOR (c:Chunk) ON EACH [c.text] "
+    "OPTIONS {indexConfig: {`fulltext.analyzer`: 'cjk'}}",
+]
+
+SCHEMA_STATEMENTS = CONSTRAINTS + INDEXES
@@ -1,26 +1,80 @@
 from __future__ import annotations
 
 import argparse
-import json
+import multiprocessing
 import os
+import queue
+import re
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional
+from typing import Any, Dict, Iterable, List
 
 from neo4j import GraphDatabase
+from neo4j.exceptions import TransientError
+
+from io_utils import read_jsonl, read_jsonl_buffered
+from neo4j_schema import SCHEMA_STATEMENTS
 
 
 # ----------------------------
 # Utils
 # ----------------------------
+# 小于该大小的文件一次 read() 读入、逐行惰性解析；更大的逐行流式读
+STREAM_THRESHOLD_BYTES = 64_000_000
+
+
 def iter_jsonl(path: Path) -> Iterable[Dict[str, Any]]:
     if not path.exists():
         raise FileNotFoundError(f"JSONL not found: {path}")
-    with path.open("r", encoding="utf-8") as f:
-        for line in f:
-            s = line.strip()
-            if not s:
-                continue
-            yield json.loads(s)
+    if path.stat().st_size > STREAM_THRESHOLD_BYTES:
+        yield from read_jsonl(path)
+    else:
+        yield from read_jsonl_buffered(path)
+
+
+_EOF = object()
+
+
+def iter_jsonl_prefetched(path: Path, maxsize: int) -> Iterable[Dict[str, Any]]:
+    """
+    后台线程读文件 + 解析，主循环只从队列取：文件 I/O 与组批/提交重叠。
+    读线程出错时在主循环里原样抛出。
+    """
+    q: queue.Queue = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def produce() -> None:
+        try:
+            for obj in iter_jsonl(path):
+                if stop.is_set():
+                    return
+                q.put(obj)
+        except BaseException as e:
+            q.put(e)
+        q.put(_EOF)
+
+    t = threading.Thread(target=produce, name=f"jsonl-{path.name}", daemon=True)
+    t.start()
+    try:
+        while True:
+            item = q.get()
+            if item is _EOF:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        # 主循环提前退出时让读线程停下，顺手清掉队列避免它卡在 put 上
+        stop.set()
+        while t.is_alive():
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                t.join(0.01)
 
 
 def project_root() -> Path:
@@ -28,18 +82,24 @@ def project_root() -> Path:
     return Path(__file__).resolve().parents[1]
 
 
+def _s(d: Dict[str, Any], key: str) -> Any:
+    # 取字符串字段：一次 get + 一次精确类型判断，非 str 一律当 None
+    v = d.get(key)
+    return v if type(v) is str else None
+
+
 # ----------------------------
 # Participant naming rules
 # ----------------------------
 # 代词：永远不建节点
-PRONOUNS = {"他", "她", "他们", "她们", "我们", "你", "你们", "众人", "大家"}
+PRONOUNS = frozenset({"他", "她", "他们", "她们", "我们", "你", "你们", "众人", "大家"})
 
 # 很常见的群体名/职务泛称，你可以按需要继续扩充
-GENERIC_PEOPLE = {"学生们", "值日生", "走读生", "男男女女", "女生", "青年人", "瘦高个的青年人", "跛女子"}
+GENERIC_PEOPLE = frozenset({"学生们", "值日生", "走读生", "男男女女", "女生", "青年人", "瘦高个的青年人", "跛女子"})
 
 # 泛称参与者白名单（推荐保守：避免把“路人甲/某人/他”这类污染进图）
 # 你可以逐步扩充，或者把白名单逻辑关掉（见下方注释）
-GENERIC_PARTICIPANTS = {
+GENERIC_PARTICIPANTS = frozenset({
     "值日生",
     "走读生们",
     "男男女女",
@@ -50,81 +110,271 @@ GENERIC_PARTICIPANTS = {
     "同学们",
     "高一（1）班的值日生",
     "瘦高个的青年人",
-}
-
-
-def normalize_person_name(name: Optional[str], mention: Optional[str]) -> Optional[str]:
-    """
-    事件 participants 里：优先用 name，否则用 mention。
-    对明显代词返回 None（跳过）。
-    """
-    cand = (name or "").strip() or (mention or "").strip()
-    if not cand:
-        return None
-    if cand in PRONOUNS:
-        return None
-    return cand
-
-
-def normalize_participant_mention(mention: Optional[str]) -> Optional[str]:
-    """
-    泛称参与者：只使用 mention，不接受代词。
-    """
-    if not isinstance(mention, str):
-        return None
-    m = mention.strip()
-    if not m:
-        return None
-    if m in PRONOUNS:
-        return None
-    return m
+})
 
 
 # ----------------------------
 # Neo4j Writer
 # ----------------------------
 class Neo4jWriter:
-    def __init__(self, uri: str, user: str, password: str, database: str):
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
+    """
+    write()：同步执行一个写事务（建约束、收尾统计等需要顺序执行的步骤）。
+    submit()：丢进线程池并发执行；drain() 等待本阶段全部完成。
+    两者都复用当前线程的长连 session，不再每批开关一次。
+    execute_write 本身会对 TransientError（死锁/锁超时）退避重试，并发 MERGE 同一节点时靠它兜底。
+    unmanaged=True 时改用显式 begin/commit，只对 TransientError 做有限次指数退避重试，其它错误直接抛出。
+    """
+
+    def __init__(
+        self,
+        uri: str,
+        user: str,
+        password: str,
+        database: str,
+        workers: int = 16,
+        pool_size: int = 32,
+        acquisition_timeout: float = 60.0,
+        fetch_size: int = 1000,
+        unmanaged: bool = False,
+        retries: int = 3,
+    ):
+        self.driver = GraphDatabase.driver(
+            uri,
+            auth=(user, password),
+            max_connection_pool_size=pool_size,
+            connection_acquisition_timeout=acquisition_timeout,
+            max_connection_lifetime=3600,
+            connection_timeout=30.0,
+            keep_alive=True,
+        )
         self.database = database
+        self.fetch_size = fetch_size
+        self.unmanaged = unmanaged
+        self.retries = retries
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._local = threading.local()
+        self._sessions: List[Any] = []
+        self._sessions_lock = threading.Lock()
+        self._futures: List[Future] = []
 
     def close(self) -> None:
+        self.drain()
+        self._pool.shutdown()
+        for session in self._sessions:
+            session.close()
         self.driver.close()
 
     def write(self, func, *args, **kwargs):
-        with self.driver.session(database=self.database) as session:
+        return self._run(func, args, kwargs)
+
+    def _thread_session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self.driver.session(database=self.database, fetch_size=self.fetch_size)
+            self._local.session = session
+            with self._sessions_lock:
+                self._sessions.append(session)
+        return session
+
+    def _run(self, func, args, kwargs):
+        session = self._thread_session()
+        if not self.unmanaged:
             return session.execute_write(func, *args, **kwargs)
+        for attempt in range(self.retries + 1):
+            try:
+                with session.begin_transaction() as tx:
+                    result = func(tx, *args, **kwargs)
+                    tx.commit()
+                return result
+            except TransientError:
+                if attempt == self.retries:
+                    raise
+                time.sleep(0.2 * 2**attempt)
+
+    def _run_autocommit(self, func, args, kwargs):
+        return func(self._thread_session(), *args, **kwargs)
+
+    def submit(self, func, *args, **kwargs) -> Future:
+        fut = self._pool.submit(self._run, func, args, kwargs)
+        self._futures.append(fut)
+        return fut
+
+    def submit_autocommit(self, func, *args, **kwargs) -> Future:
+        """
+        func(session, ...) 不包事务：给 apoc.periodic.iterate 这类自己管理事务的过程用。
+        """
+        fut = self._pool.submit(self._run_autocommit, func, args, kwargs)
+        self._futures.append(fut)
+        return fut
+
+    def drain(self) -> None:
+        """
+        等待已提交的批次全部写完；任一批失败则抛出。
+        """
+        futures, self._futures = self._futures, []
+        for fut in as_completed(futures):
+            fut.result()
+
+
+class BatchFlusher:
+    """
+    攒满 cap 行就交给 flush_fn；主循环里只剩一次 add 调用。
+    批次会被线程池异步消费，所以满了换一个新 list，而不是 clear 原来的。
+    """
+
+    __slots__ = ("buf", "cap", "flush_fn")
+
+    def __init__(self, cap: int, flush_fn) -> None:
+        self.buf: List[Dict[str, Any]] = []
+        self.cap = cap
+        self.flush_fn = flush_fn
+
+    def add(self, row: Dict[str, Any]) -> None:
+        buf = self.buf
+        buf.append(row)
+        if len(buf) >= self.cap:
+            self.buf = []
+            self.flush_fn(buf)
+
+    def flush(self) -> None:
+        if self.buf:
+            buf, self.buf = self.buf, []
+            self.flush_fn(buf)
+
+
+def dedupe_coalesce(rows: List[Dict[str, Any]], key: tuple) -> List[Dict[str, Any]]:
+    """
+    同一 MERGE 键的重复行合并成一行：先到的值优先，空值由后面的行补上，
+    与 Cypher 里 SET x = coalesce(x, row.x) 的效果一致。
+    """
+    merged: Dict[tuple, Dict[str, Any]] = {}
+    for r in rows:
+        k = tuple(r[f] for f in key)
+        first = merged.get(k)
+        if first is None:
+            merged[k] = r
+            continue
+        for f, v in r.items():
+            if first.get(f) is None:
+                first[f] = v
+    return list(merged.values())
+
+
+def dedupe_last(rows: List[Dict[str, Any]], key: tuple) -> List[Dict[str, Any]]:
+    # 属性是直接 SET（后写覆盖）的，保留最后一行即可
+    return list({tuple(r[f] for f in key): r for r in rows}.values())
+
+
+# 节点级、依赖文件顺序的字段：首次出现位置 + 首个非空属性
+ENTITY_NODE_FIELDS = ("occupation", "status", "hometown", "traits")
+
+
+def carry_first_seen(row: Dict[str, Any], seen: Dict[tuple, Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    按文件顺序在 Python 侧算好节点级字段并写回 row：
+    first_seen_chunk/chapter 取该实体第一次出现的位置，属性取目前为止第一个非空值。
+    同一实体的所有非空取值因此一致，批次并发提交、先后不定也不影响 coalesce 的结果。
+    """
+    k = (row["kind"], row["name"])
+    s = seen.get(k)
+    if s is None:
+        s = seen[k] = {"first_seen_chunk": row["chunk_id"], "first_seen_chapter": row["chapter_id"]}
+        for f in ENTITY_NODE_FIELDS:
+            s[f] = row.get(f)
+    else:
+        for f in ENTITY_NODE_FIELDS:
+            if s[f] is None:
+                s[f] = row.get(f)
+    if row["kind"] == "Person":
+        row.update(s)
+    else:
+        row["first_seen_chunk"] = s["first_seen_chunk"]
+        row["first_seen_chapter"] = s["first_seen_chapter"]
+    return row
+
+
+ENTITY_KEY = ("kind", "name", "chunk_id")
+# 事件内嵌列表的去重键（event_id / chunk_id 由外层事件确定）
+EVENT_PART_KEY = ("person_name",)
+EVENT_PART_GENERIC_KEY = ("participant_key",)
+REL_KEY = ("head", "tail", "chunk_id", "evidence")
+EVENT_KEY = ("event_id",)
 
 
 # ----------------------------
 # Schema / Constraints
 # ----------------------------
-CONSTRAINTS = [
-    "CREATE CONSTRAINT book_title IF NOT EXISTS FOR (b:Book) REQUIRE b.title IS UNIQUE",
-    "CREATE CONSTRAINT chapter_id IF NOT EXISTS FOR (c:Chapter) REQUIRE c.chapter_id IS UNIQUE",
-    "CREATE CONSTRAINT chunk_id IF NOT EXISTS FOR (c:Chunk) REQUIRE c.chunk_id IS UNIQUE",
-    "CREATE CONSTRAINT person_name IF NOT EXISTS FOR (p:Person) REQUIRE p.name IS UNIQUE",
-    "CREATE CONSTRAINT place_name IF NOT EXISTS FOR (p:Place) REQUIRE p.name IS UNIQUE",
-    "CREATE CONSTRAINT org_name IF NOT EXISTS FOR (o:Org) REQUIRE o.name IS UNIQUE",
-    "CREATE CONSTRAINT event_id IF NOT EXISTS FOR (e:Event) REQUIRE e.event_id IS UNIQUE",
-    # 新增：Participant 唯一键
-    "CREATE CONSTRAINT participant_key IF NOT EXISTS FOR (p:Participant) REQUIRE p.key IS UNIQUE",
-]
-
-
+# DDL 在 neo4j_schema，与 API 启动时的 ensure_neo4j_schema 共用
 def tx_create_constraints(tx) -> None:
-    for c in CONSTRAINTS:
+    for c in SCHEMA_STATEMENTS:
         tx.run(c)
 
 
+def tx_update_mention_counts(tx) -> None:
+    """
+    导入结束后统一回写 n.mention_count，列表接口直接读属性，不再逐行 count 子图。
+    """
+    cypher = """
+    MATCH (n)
+    WHERE n:Person OR n:Event
+    SET n.mention_count = count { (n)-[:MENTIONED_IN]->(:Chunk) }
+    """
+    tx.run(cypher)
+
+
+def group_by_chunk(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    按 chunk_id 分组成 [{chunk_id, items}]：同一 chunk 的多行只做一次 Chunk 索引查找。
+    """
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for r in rows:
+        groups.setdefault(r["chunk_id"], []).append(r)
+    return [{"chunk_id": cid, "items": items} for cid, items in groups.items()]
+
+
+# ----------------------------
+# 列式参数：$cols = {字段: [值...]}，每个键在 PackStream 里只编码一次，而不是每行一份
+# ----------------------------
+CHUNK_FIELDS = ("chapter_id", "chapter_title", "chunk_id", "text", "start_char", "end_char")
+REL_FIELDS = ("head", "tail", "chunk_id", "evidence", "confidence", "family_role")
+
+
+def to_columns(rows: List[Dict[str, Any]], fields: tuple) -> Dict[str, List[Any]]:
+    return {f: [r.get(f) for r in rows] for f in fields}
+
+
+@lru_cache(maxsize=None)
+def unwind_columns(fields: tuple, carry: str = "") -> str:
+    """
+    生成把 $cols 还原成逐行 row 的 Cypher 前缀；carry 是需要带过 WITH 的已有变量（如 "b, "）。
+    """
+    row_map = ", ".join(f"{f}: $cols.{f}[i]" for f in fields)
+    return f"""
+    UNWIND range(0, size($cols.{fields[0]}) - 1) AS i
+    WITH {carry}{{{row_map}}} AS row"""
+
+
+# --bulk_load：空库导入时关系用 CREATE 代替 MERGE（关系 MERGE 要扫端点的全部关系，度数越高越慢）
+# 前提是重复行已在 Python 里全局去重；节点仍然 MERGE（唯一约束索引查找，代价低）
+_MERGE_REL_RE = re.compile(r"MERGE (\(\w+\)-\[)")
+
+
+@lru_cache(maxsize=None)
+def _create_rels(cypher: str) -> str:
+    return _MERGE_REL_RE.sub(r"CREATE \1", cypher)
+
+
+def _rel_verb(cypher: str, create_rels: bool) -> str:
+    return _create_rels(cypher) if create_rels else cypher
+
+
 # ----------------------------
 # Ingest: Book / Chapter / Chunk
 # ----------------------------
 def tx_ingest_chunks(tx, book_title: str, rows: List[Dict[str, Any]]) -> None:
     cypher = """
     MERGE (b:Book {title: $book_title})
-    WITH b
-    UNWIND $rows AS row
+    WITH b""" + unwind_columns(CHUNK_FIELDS, "b, ") + """
       MERGE (ch:Chapter {chapter_id: row.chapter_id})
         SET ch.title = coalesce(ch.title, row.chapter_title)
       MERGE (b)-[:HAS_CHAPTER]->(ch)
@@ -136,76 +386,80 @@ def tx_ingest_chunks(tx, book_title: str, rows: List[Dict[str, Any]]) -> None:
             ck.end_char    = row.end_char
       MERGE (ch)-[:HAS_CHUNK]->(ck)
     """
-    tx.run(cypher, book_title=book_title, rows=rows)
+    tx.run(cypher, book_title=book_title, cols=to_columns(rows, CHUNK_FIELDS))
 
 
 # ----------------------------
 # Ingest: Entities
 # ----------------------------
-def tx_ingest_people_and_mentions(tx, rows: List[Dict[str, Any]]) -> None:
+def tx_ingest_entities(tx, rows: List[Dict[str, Any]], create_rels: bool = False) -> None:
     """
+    Person / Place / Org 合在一个 UNWIND 里写，按 row.kind 分到各自的子查询。
     rows:
-      {name, chapter_id, chunk_id, evidence, occupation, status, hometown, traits, is_generic}
+      {kind, name, chapter_id, chunk_id, evidence}
+      Person 额外带 {occupation, status, hometown, traits, is_generic}
+      以及 carry_first_seen 写入的 {first_seen_chunk, first_seen_chapter}
     """
     cypher = """
-    UNWIND $rows AS row
+    UNWIND $groups AS g
+    MATCH (ck:Chunk {chunk_id: g.chunk_id})
+    UNWIND g.items AS row
+    CALL {
+      WITH row, ck
+      WITH row, ck WHERE row.kind = 'Person'
       MERGE (p:Person {name: row.name})
         SET p.is_generic = coalesce(p.is_generic, row.is_generic),
-            p.first_seen_chunk = coalesce(p.first_seen_chunk, row.chunk_id),
-            p.first_seen_chapter = coalesce(p.first_seen_chapter, row.chapter_id)
+            p.first_seen_chunk = coalesce(p.first_seen_chunk, row.first_seen_chunk),
+            p.first_seen_chapter = coalesce(p.first_seen_chapter, row.first_seen_chapter)
 
-      // 只在属性为空时填入（避免反复覆盖；更复杂的合并可在 normalize 阶段做）
+      // 只在属性为空时填入；first_seen_* 与属性都已按文件顺序在 Python 侧算好（carry_first_seen），
+      // 批次并发提交的先后不影响结果
       SET p.occupation = coalesce(p.occupation, row.occupation),
           p.status     = coalesce(p.status, row.status),
           p.hometown   = coalesce(p.hometown, row.hometown),
           p.traits     = coalesce(p.traits, row.traits)
 
-      WITH p, row
-      MATCH (ck:Chunk {chunk_id: row.chunk_id})
       MERGE (p)-[m:MENTIONED_IN {chunk_id: row.chunk_id}]->(ck)
         SET m.evidence = coalesce(m.evidence, row.evidence)
-    """
-    tx.run(cypher, rows=rows)
-
-
-def tx_ingest_places(tx, rows: List[Dict[str, Any]]) -> None:
-    cypher = """
-    UNWIND $rows AS row
+    }
+    CALL {
+      WITH row, ck
+      WITH row, ck WHERE row.kind = 'Place'
       MERGE (p:Place {name: row.name})
-        SET p.first_seen_chunk = coalesce(p.first_seen_chunk, row.chunk_id),
-            p.first_seen_chapter = coalesce(p.first_seen_chapter, row.chapter_id)
-      WITH p, row
-      MATCH (ck:Chunk {chunk_id: row.chunk_id})
+        SET p.first_seen_chunk = coalesce(p.first_seen_chunk, row.first_seen_chunk),
+            p.first_seen_chapter = coalesce(p.first_seen_chapter, row.first_seen_chapter)
       MERGE (p)-[m:MENTIONED_IN {chunk_id: row.chunk_id}]->(ck)
         SET m.evidence = coalesce(m.evidence, row.evidence)
-    """
-    tx.run(cypher, rows=rows)
-
-
-def tx_ingest_orgs(tx, rows: List[Dict[str, Any]]) -> None:
-    cypher = """
-    UNWIND $rows AS row
+    }
+    CALL {
+      WITH row, ck
+      WITH row, ck WHERE row.kind = 'Org'
       MERGE (o:Org {name: row.name})
-        SET o.first_seen_chunk = coalesce(o.first_seen_chunk, row.chunk_id),
-            o.first_seen_chapter = coalesce(o.first_seen_chapter, row.chapter_id)
-      WITH o, row
-      MATCH (ck:Chunk {chunk_id: row.chunk_id})
+        SET o.first_seen_chunk = coalesce(o.first_seen_chunk, row.first_seen_chunk),
+            o.first_seen_chapter = coalesce(o.first_seen_chapter, row.first_seen_chapter)
       MERGE (o)-[m:MENTIONED_IN {chunk_id: row.chunk_id}]->(ck)
         SET m.evidence = coalesce(m.evidence, row.evidence)
+    }
     """
-    tx.run(cypher, rows=rows)
+    tx.run(_rel_verb(cypher, create_rels), groups=group_by_chunk(rows))
 
 
 # ----------------------------
 # Ingest: Events
 # ----------------------------
-def tx_ingest_events(tx, rows: List[Dict[str, Any]]) -> None:
+def tx_ingest_events(tx, rows: List[Dict[str, Any]], create_rels: bool = False) -> None:
     """
+    Event 连同它的地点 / 参与者在同一个 UNWIND 里写完。
     rows:
-      {event_id, chunk_id, chapter_id, event_type, summary, trigger, salience}
+      {event_id, chunk_id, chapter_id, event_type, summary, trigger, salience,
+       places: [{place_name, evidence}],
+       participants: [{person_name, role, evidence}],
+       generic_participants: [{participant_key, mention, role, evidence}]}
     """
     cypher = """
-    UNWIND $rows AS row
+    UNWIND $groups AS g
+    MATCH (ck:Chunk {chunk_id: g.chunk_id})
+    UNWIND g.items AS row
       MERGE (e:Event {event_id: row.event_id})
         SET e.chunk_id   = row.chunk_id,
             e.chapter_id = row.chapter_id,
@@ -213,60 +467,29 @@ def tx_ingest_events(tx, rows: List[Dict[str, Any]]) -> None:
             e.summary    = row.summary,
             e.trigger    = row.trigger,
             e.salience   = row.salience
-      WITH e, row
-      MATCH (ck:Chunk {chunk_id: row.chunk_id})
       MERGE (e)-[s:SUPPORTED_BY {chunk_id: row.chunk_id}]->(ck)
         SET s.evidence = coalesce(s.evidence, row.trigger)
-    """
-    tx.run(cypher, rows=rows)
-
 
-def tx_ingest_event_places(tx, rows: List[Dict[str, Any]]) -> None:
+      FOREACH (pl IN row.places |
+        MERGE (p:Place {name: pl.place_name})
+        MERGE (e)-[r:HAPPENS_AT {chunk_id: row.chunk_id}]->(p)
+          SET r.evidence = coalesce(r.evidence, pl.evidence)
+      )
+      FOREACH (pa IN row.participants |
+        MERGE (p:Person {name: pa.person_name})
+        MERGE (p)-[r:PARTICIPATES_IN {event_id: row.event_id, chunk_id: row.chunk_id}]->(e)
+          SET r.role     = coalesce(r.role, pa.role),
+              r.evidence = coalesce(r.evidence, pa.evidence)
+      )
+      FOREACH (gp IN row.generic_participants |
+        MERGE (p:Participant {key: gp.participant_key})
+          SET p.mention = gp.mention
+        MERGE (p)-[r:PARTICIPATES_IN {event_id: row.event_id, chunk_id: row.chunk_id}]->(e)
+          SET r.role     = coalesce(r.role, gp.role),
+              r.evidence = coalesce(r.evidence, gp.evidence)
+      )
     """
-    rows:
-      {event_id, place_name, chunk_id, evidence}
-    """
-    cypher = """
-    UNWIND $rows AS row
-      MATCH (e:Event {event_id: row.event_id})
-      MERGE (p:Place {name: row.place_name})
-      MERGE (e)-[r:HAPPENS_AT {chunk_id: row.chunk_id}]->(p)
-        SET r.evidence = coalesce(r.evidence, row.evidence)
-    """
-    tx.run(cypher, rows=rows)
-
-
-def tx_ingest_event_participants(tx, rows: List[Dict[str, Any]]) -> None:
-    """
-    rows:
-      {event_id, person_name, chunk_id, role, evidence}
-    """
-    cypher = """
-    UNWIND $rows AS row
-      MATCH (e:Event {event_id: row.event_id})
-      MERGE (p:Person {name: row.person_name})
-      MERGE (p)-[r:PARTICIPATES_IN {event_id: row.event_id, chunk_id: row.chunk_id}]->(e)
-        SET r.role     = coalesce(r.role, row.role),
-            r.evidence = coalesce(r.evidence, row.evidence)
-    """
-    tx.run(cypher, rows=rows)
-
-
-def tx_ingest_event_participants_generic(tx, rows: List[Dict[str, Any]]) -> None:
-    """
-    rows:
-      {event_id, participant_key, mention, chunk_id, role, evidence}
-    """
-    cypher = """
-    UNWIND $rows AS row
-      MATCH (e:Event {event_id: row.event_id})
-      MERGE (p:Participant {key: row.participant_key})
-        SET p.mention = row.mention
-      MERGE (p)-[r:PARTICIPATES_IN {event_id: row.event_id, chunk_id: row.chunk_id}]->(e)
-        SET r.role     = coalesce(r.role, row.role),
-            r.evidence = coalesce(r.evidence, row.evidence)
-    """
-    tx.run(cypher, rows=rows)
+    tx.run(_rel_verb(cypher, create_rels), groups=group_by_chunk(rows))
 
 
 # ----------------------------
@@ -277,20 +500,135 @@ ALLOWED_REL_TYPES = {
 }
 
 
-def tx_ingest_relations_of_type(tx, rel_type: str, rows: List[Dict[str, Any]]) -> None:
-    # Neo4j 关系类型不能参数化，只能拼字符串；所以一定要白名单校验
-    if rel_type not in ALLOWED_REL_TYPES:
-        raise ValueError(f"Unsupported relation type: {rel_type}")
-
-    cypher = f"""
-    UNWIND $rows AS row
+# Neo4j 关系类型不能参数化，只能拼字符串；只对白名单里的类型预先生成（导入时建好，查询文本固定，服务端计划缓存可复用）
+REL_MERGE_CYPHER = {
+    rt: f"""
       MERGE (h:Person {{name: row.head}})
       MERGE (t:Person {{name: row.tail}})
-      MERGE (h)-[r:{rel_type} {{chunk_id: row.chunk_id, evidence: row.evidence}}]->(t)
+      MERGE (h)-[r:{rt} {{chunk_id: row.chunk_id, evidence: row.evidence}}]->(t)
         SET r.confidence = row.confidence,
             r.family_role = row.family_role
     """
-    tx.run(cypher, rows=rows)
+    for rt in ALLOWED_REL_TYPES
+}
+REL_CYPHER = {rt: unwind_columns(REL_FIELDS) + body for rt, body in REL_MERGE_CYPHER.items()}
+
+
+def tx_ingest_relations_of_type(
+    tx, rel_type: str, rows: List[Dict[str, Any]], create_rels: bool = False
+) -> None:
+    if rel_type not in REL_CYPHER:
+        raise ValueError(f"Unsupported relation type: {rel_type}")
+    tx.run(_rel_verb(REL_CYPHER[rel_type], create_rels), cols=to_columns(rows, REL_FIELDS))
+
+
+# --apoc：服务端分批 + 并行 + 死锁重试；同一批里 Person 节点可能被多个线程同时 MERGE，靠 retries 兜底
+APOC_REL_BATCH = 10_000
+
+# 关系类型走参数 $rel_type，六种类型共用一条语句（一份执行计划）；白名单仍在 Python 侧检查
+APOC_REL_MERGE = """
+  MERGE (h:Person {name: row.head})
+  MERGE (t:Person {name: row.tail})
+  WITH h, t, row, {confidence: row.confidence, family_role: row.family_role} AS props
+  CALL apoc.merge.relationship(h, $rel_type, {chunk_id: row.chunk_id, evidence: row.evidence}, props, t, props)
+  YIELD rel
+  RETURN count(rel)
+"""
+APOC_REL_CREATE = """
+  MERGE (h:Person {name: row.head})
+  MERGE (t:Person {name: row.tail})
+  CALL apoc.create.relationship(
+    h, $rel_type,
+    {chunk_id: row.chunk_id, evidence: row.evidence, confidence: row.confidence, family_role: row.family_role},
+    t
+  )
+  YIELD rel
+  RETURN count(rel)
+"""
+
+
+def apoc_ingest_relations_of_type(
+    session, rel_type: str, rows: List[Dict[str, Any]], create_rels: bool = False
+) -> None:
+    cypher = """
+    CALL apoc.periodic.iterate(
+      'UNWIND $rows AS row RETURN row',
+      $action,
+      {batchSize: 1000, parallel: true, concurrency: 8, retries: 3, params: {rows: $rows, rel_type: $rel_type}}
+    )
+    YIELD failedBatches, errorMessages
+    RETURN failedBatches, errorMessages
+    """
+    if rel_type not in ALLOWED_REL_TYPES:
+        raise ValueError(f"Unsupported relation type: {rel_type}")
+    action = APOC_REL_CREATE if create_rels else APOC_REL_MERGE
+    rec = session.run(cypher, action=action, rows=rows, rel_type=rel_type).single()
+    if rec and rec["failedBatches"]:
+        raise RuntimeError(f"apoc.periodic.iterate failed for {rel_type}: {rec['errorMessages']}")
+
+
+# ----------------------------
+# Row shaping
+# ----------------------------
+def _attr_map(attrs: Any) -> Dict[str, str]:
+    # 一次遍历建 key -> value；倒序构建，同名 key 以第一个为准
+    if not isinstance(attrs, list):
+        return {}
+    return {
+        a["key"]: a["value"]
+        for a in reversed(attrs)
+        if isinstance(a, dict) and isinstance(a.get("key"), str) and isinstance(a.get("value"), str)
+    }
+
+
+def entity_rows(obj: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    entities JSONL 一行 -> tx_ingest_entities 的行；纯函数，可丢给进程池。
+    """
+    cid = obj.get("chunk_id")
+    chap = obj.get("chapter_id")
+    if not isinstance(cid, str) or not isinstance(chap, str):
+        return []
+
+    ents = obj.get("entities", [])
+    if not isinstance(ents, list):
+        return []
+
+    out: List[Dict[str, Any]] = []
+    for e in ents:
+        if not isinstance(e, dict):
+            continue
+        et = e.get("type")
+        name = e.get("name")
+        evidence = _s(e, "evidence")
+        attrs = e.get("attributes", [])
+
+        if not isinstance(name, str) or not name.strip():
+            continue
+
+        row_base = {
+            "kind": et,
+            "name": name.strip(),
+            "chunk_id": cid,
+            "chapter_id": chap,
+            "evidence": evidence,
+        }
+
+        if et == "Person":
+            am = _attr_map(attrs)
+            out.append(
+                {
+                    **row_base,
+                    "occupation": am.get("occupation"),
+                    "status": am.get("status"),
+                    "hometown": am.get("hometown"),
+                    "traits": am.get("traits"),
+                    "is_generic": (name.strip() in GENERIC_PEOPLE),
+                }
+            )
+        elif et in ("Place", "Org"):
+            out.append(row_base)
+    return out
 
 
 # ----------------------------
@@ -304,12 +642,28 @@ def main() -> None:
     ap.add_argument("--relations", default="data/processed/relations_raw.jsonl")
     ap.add_argument("--book_title", default="平凡的世界")
     ap.add_argument("--batch", type=int, default=300)
+    ap.add_argument("--workers", type=int, default=16, help="并发写入线程数")
+    ap.add_argument("--procs", type=int, default=0, help="实体行整形的进程数（<=1 时在主进程里做）")
+    ap.add_argument("--pool_size", type=int, default=32, help="driver 连接池上限，应不小于 --workers")
+    ap.add_argument("--acq_timeout", type=float, default=60.0, help="从连接池取连接的超时（秒）")
+    ap.add_argument("--unmanaged_tx", action="store_true", help="显式 begin/commit 事务，自带有限次重试，不走 execute_write")
+    ap.add_argument("--apoc", action="store_true", help="关系用 apoc.periodic.iterate 在服务端并行写入（需安装 APOC）")
+    ap.add_argument(
+        "--bulk_load",
+        action="store_true",
+        help="空库首次导入：全量去重后关系用 CREATE 代替 MERGE（库里已有 Chunk 时拒绝执行）",
+    )
 
     # Neo4j conn (env override)
     ap.add_argument("--neo4j_uri", default=os.getenv("NEO4J_URI", "bolt://localhost:7687"))
     ap.add_argument("--neo4j_user", default=os.getenv("NEO4J_USER", "neo4j"))
     ap.add_argument("--neo4j_password", default=os.getenv("NEO4J_PASSWORD", "neo4j"))
     ap.add_argument("--neo4j_db", default=os.getenv("NEO4J_DB", "neo4j"))
+    ap.add_argument(
+        "--only_mention_counts",
+        action="store_true",
+        help="只回写 Person/Event 的 mention_count 后退出（给引入该属性之前导入的图补一次，不重新导入）",
+    )
 
     args = ap.parse_args()
 
@@ -319,121 +673,93 @@ def main() -> None:
     events_path = (root / args.events).resolve()
     relations_path = (root / args.relations).resolve()
 
-    writer = Neo4jWriter(args.neo4j_uri, args.neo4j_user, args.neo4j_password, args.neo4j_db)
+    prefetch = 4 * args.batch
+    writer = Neo4jWriter(
+        args.neo4j_uri,
+        args.neo4j_user,
+        args.neo4j_password,
+        args.neo4j_db,
+        workers=args.workers,
+        pool_size=args.pool_size,
+        acquisition_timeout=args.acq_timeout,
+        unmanaged=args.unmanaged_tx,
+    )
 
     # 1) Constraints
     writer.write(tx_create_constraints)
     print("[neo4j] constraints ensured")
 
+    if args.only_mention_counts:
+        writer.write(tx_update_mention_counts)
+        print("[neo4j] mention counts updated")
+        writer.close()
+        return
+
+    bulk = args.bulk_load
+    if bulk:
+        records, _, _ = writer.driver.execute_query("MATCH (c:Chunk) RETURN 1 LIMIT 1", database_=args.neo4j_db)
+        if records:
+            writer.close()
+            raise SystemExit("[neo4j] --bulk_load 只能用于空库：已存在 Chunk 节点")
+
+    # bulk 模式下各阶段先攒全量、全局去重后再切批提交，保证 CREATE 不会产生重复关系
+    cap = sys.maxsize if bulk else args.batch
+
+    def submit_rows(func, rows: List[Dict[str, Any]], *lead: Any) -> None:
+        for i in range(0, len(rows), args.batch):
+            writer.submit(func, *lead, rows[i : i + args.batch], create_rels=bulk)
+
     # 2) Book/Chapter/Chunk
-    chunk_rows: List[Dict[str, Any]] = []
-    for obj in iter_jsonl(chunks_path):
+    chunk_batch = BatchFlusher(args.batch, lambda rows: writer.submit(tx_ingest_chunks, args.book_title, rows))
+    for obj in iter_jsonl_prefetched(chunks_path, prefetch):
         # 基本字段校验
-        if not isinstance(obj.get("chunk_id"), str) or not isinstance(obj.get("chapter_id"), str):
-            continue
-        if not isinstance(obj.get("text"), str):
+        chunk_id = _s(obj, "chunk_id")
+        chapter_id = _s(obj, "chapter_id")
+        text = _s(obj, "text")
+        if chunk_id is None or chapter_id is None or text is None:
             continue
 
-        chunk_rows.append(
+        chunk_batch.add(
             {
-                "chapter_id": obj["chapter_id"],
+                "chapter_id": chapter_id,
                 "chapter_title": obj.get("chapter_title"),
-                "chunk_id": obj["chunk_id"],
-                "text": obj["text"],
+                "chunk_id": chunk_id,
+                "text": text,
                 "start_char": obj.get("start_char", 0),
                 "end_char": obj.get("end_char", 0),
             }
         )
-        if len(chunk_rows) >= args.batch:
-            writer.write(tx_ingest_chunks, args.book_title, chunk_rows)
-            chunk_rows = []
-    if chunk_rows:
-        writer.write(tx_ingest_chunks, args.book_title, chunk_rows)
+    chunk_batch.flush()
+    # 后续各阶段都要 MATCH Chunk，必须先全部落库
+    writer.drain()
     print("[neo4j] chunks ingested")
 
     # 3) Entities
-    people_rows: List[Dict[str, Any]] = []
-    place_rows: List[Dict[str, Any]] = []
-    org_rows: List[Dict[str, Any]] = []
-
-    def pick_attr(attrs: Any, key: str) -> Optional[str]:
-        if not isinstance(attrs, list):
-            return None
-        for a in attrs:
-            if isinstance(a, dict) and a.get("key") == key and isinstance(a.get("value"), str):
-                return a["value"]
-        return None
-
-    for obj in iter_jsonl(entities_path):
-        cid = obj.get("chunk_id")
-        chap = obj.get("chapter_id")
-        if not isinstance(cid, str) or not isinstance(chap, str):
-            continue
-
-        ents = obj.get("entities", [])
-        if not isinstance(ents, list):
-            continue
-
-        for e in ents:
-            if not isinstance(e, dict):
-                continue
-            et = e.get("type")
-            name = e.get("name")
-            evidence = e.get("evidence")
-            attrs = e.get("attributes", [])
-
-            if not isinstance(name, str) or not name.strip():
-                continue
-
-            row_base = {
-                "name": name.strip(),
-                "chunk_id": cid,
-                "chapter_id": chap,
-                "evidence": evidence if isinstance(evidence, str) else None,
-            }
-
-            if et == "Person":
-                people_rows.append(
-                    {
-                        **row_base,
-                        "occupation": pick_attr(attrs, "occupation"),
-                        "status": pick_attr(attrs, "status"),
-                        "hometown": pick_attr(attrs, "hometown"),
-                        "traits": pick_attr(attrs, "traits"),
-                        "is_generic": (name.strip() in GENERIC_PEOPLE),
-                    }
-                )
-            elif et == "Place":
-                place_rows.append(row_base)
-            elif et == "Org":
-                org_rows.append(row_base)
-
-            if len(people_rows) >= args.batch:
-                writer.write(tx_ingest_people_and_mentions, people_rows)
-                people_rows = []
-            if len(place_rows) >= args.batch:
-                writer.write(tx_ingest_places, place_rows)
-                place_rows = []
-            if len(org_rows) >= args.batch:
-                writer.write(tx_ingest_orgs, org_rows)
-                org_rows = []
-
-    if people_rows:
-        writer.write(tx_ingest_people_and_mentions, people_rows)
-    if place_rows:
-        writer.write(tx_ingest_places, place_rows)
-    if org_rows:
-        writer.write(tx_ingest_orgs, org_rows)
+    ent_batch = BatchFlusher(cap, lambda rows: submit_rows(tx_ingest_entities, dedupe_coalesce(rows, ENTITY_KEY)))
+    # 批次在多线程里并发提交、落库顺序不定；依赖文件顺序的节点字段在这里按读入顺序先算好
+    ent_seen: Dict[tuple, Dict[str, Any]] = {}
+
+    if args.procs > 1:
+        # 行整形是纯 CPU 活，GIL 下线程帮不上忙；imap 保序，carry_first_seen 看到的仍是文件顺序
+        with multiprocessing.Pool(args.procs) as pool:
+            for rows in pool.imap(entity_rows, iter_jsonl(entities_path), chunksize=512):
+                for row in rows:
+                    ent_batch.add(carry_first_seen(row, ent_seen))
+    else:
+        for obj in iter_jsonl_prefetched(entities_path, prefetch):
+            for row in entity_rows(obj):
+                ent_batch.add(carry_first_seen(row, ent_seen))
+
+    ent_batch.flush()
+    writer.drain()
 
     print("[neo4j] entities ingested")
 
     # 4) Events
-    ev_rows: List[Dict[str, Any]] = []
-    ev_place_rows: List[Dict[str, Any]] = []
-    ev_part_rows: List[Dict[str, Any]] = []
-    ev_part_generic_rows: List[Dict[str, Any]] = []
+    # 地点 / 参与者挂在所属事件的行里，和 Event 一起写
+    ev_batch = BatchFlusher(cap, lambda rows: submit_rows(tx_ingest_events, dedupe_last(rows, EVENT_KEY)))
 
-    for obj in iter_jsonl(events_path):
+    for obj in iter_jsonl_prefetched(events_path, prefetch):
         cid = obj.get("chunk_id")
         chap = obj.get("chapter_id")
         if not isinstance(cid, str) or not isinstance(chap, str):
@@ -456,32 +782,16 @@ def main() -> None:
             if not isinstance(event_type, str) or not isinstance(summary, str) or not isinstance(trigger, str):
                 continue
 
-            ev_rows.append(
-                {
-                    "event_id": event_id,
-                    "chunk_id": cid,
-                    "chapter_id": chap,
-                    "event_type": event_type,
-                    "summary": summary,
-                    "trigger": trigger,
-                    "salience": int(salience) if isinstance(salience, int) else 1,
-                }
-            )
+            places: List[Dict[str, Any]] = []
+            part_rows: List[Dict[str, Any]] = []
+            generic_rows: List[Dict[str, Any]] = []
 
             # place
             place = e.get("place")
             if isinstance(place, dict):
                 pn = place.get("name")
-                pe = place.get("evidence")
                 if isinstance(pn, str) and pn.strip():
-                    ev_place_rows.append(
-                        {
-                            "event_id": event_id,
-                            "place_name": pn.strip(),
-                            "chunk_id": cid,
-                            "evidence": pe if isinstance(pe, str) else None,
-                        }
-                    )
+                    places.append({"place_name": pn.strip(), "evidence": _s(place, "evidence")})
 
             # participants
             participants = e.get("participants", [])
@@ -490,23 +800,20 @@ def main() -> None:
                     if not isinstance(p, dict):
                         continue
 
-                    # 1) 具名 -> Person
-                    person_name = normalize_person_name(p.get("name"), p.get("mention"))
+                    name = p.get("name")
+                    mention = p.get("mention")
+                    role = _s(p, "role")
+                    evidence = _s(p, "evidence")
+
+                    # 1) 具名 -> Person：优先用 name，否则用 mention；代词跳过
+                    person_name = (name or "").strip() or (mention or "").strip()
                     if person_name and person_name not in PRONOUNS:
-                        ev_part_rows.append(
-                            {
-                                "event_id": event_id,
-                                "person_name": person_name,
-                                "chunk_id": cid,
-                                "role": p.get("role") if isinstance(p.get("role"), str) else None,
-                                "evidence": p.get("evidence") if isinstance(p.get("evidence"), str) else None,
-                            }
-                        )
+                        part_rows.append({"person_name": person_name, "role": role, "evidence": evidence})
                         continue
 
                     # 2) 非具名 -> Participant（只处理 mention 且非代词）
-                    mention = normalize_participant_mention(p.get("mention"))
-                    if not mention:
+                    mention = mention.strip() if type(mention) is str else ""
+                    if not mention or mention in PRONOUNS:
                         continue
 
                     # 默认：白名单控制污染（推荐）
@@ -517,46 +824,58 @@ def main() -> None:
                     # pass
 
                     participant_key = mention  # 简单起见：全局唯一 key = mention
-                    ev_part_generic_rows.append(
+                    generic_rows.append(
                         {
-                            "event_id": event_id,
                             "participant_key": participant_key,
                             "mention": mention,
-                            "chunk_id": cid,
-                            "role": p.get("role") if isinstance(p.get("role"), str) else None,
-                            "evidence": p.get("evidence") if isinstance(p.get("evidence"), str) else None,
+                            "role": role,
+                            "evidence": evidence,
                         }
                     )
 
-            # batch flush
-            if len(ev_rows) >= args.batch:
-                writer.write(tx_ingest_events, ev_rows)
-                ev_rows = []
-            if len(ev_place_rows) >= args.batch:
-                writer.write(tx_ingest_event_places, ev_place_rows)
-                ev_place_rows = []
-            if len(ev_part_rows) >= args.batch:
-                writer.write(tx_ingest_event_participants, ev_part_rows)
-                ev_part_rows = []
-            if len(ev_part_generic_rows) >= args.batch:
-                writer.write(tx_ingest_event_participants_generic, ev_part_generic_rows)
-                ev_part_generic_rows = []
-
-    if ev_rows:
-        writer.write(tx_ingest_events, ev_rows)
-    if ev_place_rows:
-        writer.write(tx_ingest_event_places, ev_place_rows)
-    if ev_part_rows:
-        writer.write(tx_ingest_event_participants, ev_part_rows)
-    if ev_part_generic_rows:
-        writer.write(tx_ingest_event_participants_generic, ev_part_generic_rows)
+            ev_batch.add(
+                {
+                    "event_id": event_id,
+                    "chunk_id": cid,
+                    "chapter_id": chap,
+                    "event_type": event_type,
+                    "summary": summary,
+                    "trigger": trigger,
+                    "salience": int(salience) if isinstance(salience, int) else 1,
+                    "places": places,
+                    "participants": dedupe_coalesce(part_rows, EVENT_PART_KEY),
+                    "generic_participants": dedupe_coalesce(generic_rows, EVENT_PART_GENERIC_KEY),
+                }
+            )
+
+    ev_batch.flush()
+    writer.drain()
 
     print("[neo4j] events ingested")
 
     # 5) Relations
-    rel_buckets: Dict[str, List[Dict[str, Any]]] = {k: [] for k in ALLOWED_REL_TYPES}
+    if args.apoc:
+
+        def flush_apoc(rel_type: str, rows: List[Dict[str, Any]]) -> None:
+            rows = dedupe_last(rows, REL_KEY)
+            for i in range(0, len(rows), APOC_REL_BATCH):
+                writer.submit_autocommit(
+                    apoc_ingest_relations_of_type, rel_type, rows[i : i + APOC_REL_BATCH], create_rels=bulk
+                )
+
+        rel_buckets = {
+            k: BatchFlusher(sys.maxsize if bulk else APOC_REL_BATCH, lambda rows, k=k: flush_apoc(k, rows))
+            for k in ALLOWED_REL_TYPES
+        }
+    else:
+        rel_buckets = {
+            k: BatchFlusher(
+                cap, lambda rows, k=k: submit_rows(tx_ingest_relations_of_type, dedupe_last(rows, REL_KEY), k)
+            )
+            for k in ALLOWED_REL_TYPES
+        }
 
-    for obj in iter_jsonl(relations_path):
+    for obj in iter_jsonl_prefetched(relations_path, prefetch):
         cid = obj.get("chunk_id")
         if not isinstance(cid, str):
             continue
@@ -580,11 +899,9 @@ def main() -> None:
             if not isinstance(head, str) or not isinstance(tail, str) or not isinstance(evidence, str):
                 continue
 
-            family_role = None
-            if isinstance(meta, dict) and isinstance(meta.get("family_role"), str):
-                family_role = meta.get("family_role")
+            family_role = _s(meta, "family_role") if isinstance(meta, dict) else None
 
-            rel_buckets[t].append(
+            rel_buckets[t].add(
                 {
                     "head": head.strip(),
                     "tail": tail.strip(),
@@ -595,16 +912,16 @@ def main() -> None:
                 }
             )
 
-            if len(rel_buckets[t]) >= args.batch:
-                writer.write(tx_ingest_relations_of_type, t, rel_buckets[t])
-                rel_buckets[t] = []
-
-    for t, rows in rel_buckets.items():
-        if rows:
-            writer.write(tx_ingest_relations_of_type, t, rows)
+    for bucket in rel_buckets.values():
+        bucket.flush()
+    writer.drain()
 
     print("[neo4j] relations ingested")
 
+    # 6) 预计算列表 score
+    writer.write(tx_update_mention_counts)
+    print("[neo4j] mention counts updated")
+
     writer.close()
     print("[neo4j] DONE")
 
@@ -2,20 +2,26 @@
 from __future__ import annotations
 
 import argparse
-import json
+import re
 from collections import defaultdict
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Iterable, Optional
+from typing import Any, Iterable, Iterator, Optional
+
+import orjson
 
 
 # =========================
 # PoC 过滤：泛称人物（不当作 Person 节点）
 # =========================
-GENERIC_PERSON = {
+GENERIC_PERSON = frozenset({
     "学生", "学生们", "走读生", "值日生", "女生", "男生", "同学", "老师", "班主任", "主任",
     "父亲", "母亲", "祖母", "奶奶", "爷爷", "大哥", "二哥", "三哥", "大姐", "二姐", "姐姐", "妹妹",
     "村民", "老百姓", "群众", "干部",
-}
+})
+
+# 描述性短语：PoC 先过滤（避免把“金波他父亲”等当节点）
+_DESC_PERSON_RE = re.compile("他父亲|她父亲|他妈|她妈")
 
 
 def project_root() -> Path:
@@ -23,7 +29,9 @@ def project_root() -> Path:
     return Path(__file__).resolve().parents[1]
 
 
+@lru_cache(maxsize=8192)
 def _is_generic_person(name: str) -> bool:
+    # 同一批人名在各章反复出现，结果直接缓存
     name = name.strip()
     if not name:
         return True
@@ -31,10 +39,45 @@ def _is_generic_person(name: str) -> bool:
         return True
     if name.endswith("们"):
         return True
-    # 描述性短语：PoC 先过滤（避免把“金波他父亲”等当节点）
-    if "他父亲" in name or "她父亲" in name or "他妈" in name or "她妈" in name:
-        return True
-    return False
+    return _DESC_PERSON_RE.search(name) is not None
+
+
+def _suffix_owners(names: Iterable[str]) -> dict[str, Optional[str]]:
+    """
+    真后缀 -> 以它结尾的唯一人名；多个人名共享该后缀时为 None。
+    一次建表后按 alias 直接查，代替逐个 endswith 扫描。
+    """
+    owners: dict[str, Optional[str]] = {}
+    for n in names:
+        for i in range(1, len(n)):
+            suf = n[i:]
+            owners[suf] = n if suf not in owners else None
+    return owners
+
+
+def _dedup(s: str, pool: dict[str, str]) -> str:
+    # 手写去重池：相同取值共用一个 str 对象（不用 sys.intern，池随 main() 结束释放）
+    return pool.setdefault(s, s)
+
+
+def _resolve_chains(alias_map: dict[str, str]) -> None:
+    """
+    原地把链式 alias 解析到终点（"波" -> "金波" -> "田金波" 变成 "波" -> "田金波"），带路径压缩。
+    owner 总比 alias 长，链必然终止，不会成环。
+    """
+    for alias in alias_map:
+        target = alias_map[alias]
+        path = []
+        while target in alias_map and alias_map[target] != target:
+            path.append(target)
+            target = alias_map[target]
+        alias_map[alias] = target
+        for p in path:
+            alias_map[p] = target
+
+
+def _noop(_: Any) -> None:
+    return None
 
 
 def _sniff_format(path: Path) -> str:
@@ -55,42 +98,52 @@ def _sniff_format(path: Path) -> str:
     return "jsonl"
 
 
-def read_records(path: Path) -> list[dict[str, Any]]:
+def iter_records(path: Path) -> Iterator[dict[str, Any]]:
+    """
+    流式逐条产出记录（orjson 解析）；main() 需要多遍时各自重新打开文件。
+    """
     fmt = _sniff_format(path)
 
     if fmt == "json":
-        obj = json.loads(path.read_text(encoding="utf-8"))
+        # 顶层是单个 JSON 值，只能整体解析
+        obj = orjson.loads(path.read_bytes())
         if isinstance(obj, list):
-            return [x for x in obj if isinstance(x, dict)]
+            yield from (x for x in obj if isinstance(x, dict))
+            return
         if isinstance(obj, dict):
-            return [obj]
+            yield obj
+            return
         raise ValueError(f"Unsupported JSON top-level type: {type(obj)}")
 
     # fmt == "jsonl"
-    rows: list[dict[str, Any]] = []
-    with path.open("r", encoding="utf-8") as f:
+    with path.open("rb") as f:
         for line in f:
             line = line.strip()
             if not line:
                 continue
-            rows.append(json.loads(line))
-    # 如果 jsonl 误判（例如整个文件是一行 JSON list），做一次 fallback
-    if len(rows) == 1 and isinstance(rows[0], list):
-        # 极少见：一行里是 list
-        return [x for x in rows[0] if isinstance(x, dict)]
-    return rows
+            obj = orjson.loads(line)
+            if isinstance(obj, dict):
+                yield obj
+            elif isinstance(obj, list):
+                # jsonl 误判（例如整个文件是一行 JSON list）
+                yield from (x for x in obj if isinstance(x, dict))
+
+
+# orjson 直接输出 UTF-8 字节，中文不转义（等价 ensure_ascii=False）
+_JSON_OPTS = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+_JSONL_OPTS = orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS
 
 
 def write_json(path: Path, obj: Any) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(json.dumps(obj, ensure_ascii=False, indent=2), encoding="utf-8")
+    path.write_bytes(orjson.dumps(obj, option=_JSON_OPTS))
 
 
 def write_jsonl(path: Path, rows: Iterable[dict[str, Any]]) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
-    with path.open("w", encoding="utf-8") as f:
+    with path.open("wb", buffering=1 << 20) as f:
         for r in rows:
-            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+            f.write(orjson.dumps(r, option=_JSONL_OPTS))
 
 
 def merge_attributes(attr_lists: list[list[dict[str, Any]]]) -> list[dict[str, Any]]:
@@ -193,58 +246,71 @@ def main() -> None:
     entities_raw_path = resolve_entities_raw_path(args.entities_raw)
     out_dir = resolve_out_dir(args.out_dir)
 
-    rows = read_records(entities_raw_path)
-
-    # 1) 收集每章的人名集合（过滤泛称）
+    # 1) 收集每章的人名集合（过滤泛称）；顺带按出现顺序记下 (原名, attributes)，canonical 化留到 alias_map 建好之后
     chapter_people: dict[str, set[str]] = defaultdict(set)
     chapter_person_all: dict[str, set[str]] = defaultdict(set)
+    person_attrs: list[tuple[str, list[dict[str, Any]]]] = []
+    # 池里先放泛称集合自身的 str 对象：同名实体去重后与集合元素是同一对象，成员判断走身份比较
+    pool: dict[str, str] = {n: n for n in GENERIC_PERSON}
 
-    for r in rows:
+    for r in iter_records(entities_raw_path):
         ch = r.get("chapter_id")
-        if not ch:
-            continue
+        if isinstance(ch, str):
+            ch = _dedup(ch, pool)
+        # 每条记录只查一次章内集合，循环里直接调绑定好的 add
+        if ch:
+            add_all = chapter_person_all[ch].add
+            add_named = chapter_people[ch].add
+        else:
+            add_all = add_named = _noop
         for e in r.get("entities", []) or []:
             if e.get("type") != "Person":
                 continue
             name = (e.get("name") or "").strip()
             if not name:
                 continue
-            chapter_person_all[ch].add(name)
-            if not _is_generic_person(name):
-                chapter_people[ch].add(name)
+            name = _dedup(name, pool)
+            add_all(name)
+            if _is_generic_person(name):
+                continue
+            add_named(name)
+            attrs = e.get("attributes") or []
+            for a in attrs:
+                if isinstance(a, dict):
+                    for f in ("key", "value"):
+                        v = a.get(f)
+                        if isinstance(v, str):
+                            a[f] = _dedup(v, pool)
+            person_attrs.append((name, attrs))
 
     # 2) 章内 alias_map（短名 -> 长名，唯一候选才映射）
     alias_map: dict[str, str] = {}
     for ch, people in chapter_people.items():
-        all_names = list(people)
-        for alias in chapter_person_all[ch]:
-            alias = alias.strip()
-            if not alias or _is_generic_person(alias):
+        owners = _suffix_owners(people)
+        # 排序遍历：alias_map 的键顺序不再随 set 哈希种子变化，输出可复现
+        for alias in sorted(chapter_person_all[ch]):
+            if _is_generic_person(alias):
                 continue
-            candidates = [n for n in all_names if n.endswith(alias) and len(n) > len(alias)]
-            candidates = list(set(candidates))
-            if len(candidates) == 1:
-                alias_map[alias] = candidates[0]
+            owner = owners.get(alias)
+            if owner is not None:
+                alias_map[alias] = owner
+    _resolve_chains(alias_map)
+    # 章内人名集合只给 alias 推断用，第二遍之前释放
+    chapter_people.clear()
+    chapter_person_all.clear()
 
     def canon_name(name: str) -> str:
         return alias_map.get(name, name)
 
     # 3) canonical 人物库：canonical -> aliases + merged attributes
-    canon_store: dict[str, dict[str, Any]] = {}
     attrs_bucket: dict[str, list[list[dict[str, Any]]]] = defaultdict(list)
     alias_bucket: dict[str, set[str]] = defaultdict(set)
+    for name, attrs in person_attrs:
+        cn = canon_name(name)
+        alias_bucket[cn].add(name)
+        attrs_bucket[cn].append(attrs)
 
-    for r in rows:
-        for e in r.get("entities", []) or []:
-            if e.get("type") != "Person":
-                continue
-            name = (e.get("name") or "").strip()
-            if not name or _is_generic_person(name):
-                continue
-            cn = canon_name(name)
-            alias_bucket[cn].add(name)
-            attrs_bucket[cn].append(e.get("attributes") or [])
-
+    canon_store: dict[str, dict[str, Any]] = {}
     for cn in sorted(alias_bucket.keys()):
         canon_store[cn] = {
             "name": cn,
@@ -252,26 +318,25 @@ def main() -> None:
             "attributes": merge_attributes(attrs_bucket[cn]),
         }
 
-    # 4) 输出 clean 版 entities：把每个 chunk 的 Person name 映射成 canonical，并丢弃泛称 Person
-    clean_rows: list[dict[str, Any]] = []
-    for r in rows:
-        new_r = dict(r)
-        new_entities = []
-        for e in r.get("entities", []) or []:
-            if e.get("type") == "Person":
-                name = (e.get("name") or "").strip()
-                if not name or _is_generic_person(name):
-                    continue
-                e = dict(e)
-                e["name"] = canon_name(name)
-            new_entities.append(e)
-        new_r["entities"] = new_entities
-        clean_rows.append(new_r)
+    # 4) 第二遍：clean 版 entities，逐条改写逐条写盘。把每个 chunk 的 Person name 映射成 canonical，并丢弃泛称 Person
+    def clean_rows() -> Iterator[dict[str, Any]]:
+        # 记录是刚解析出来的，用完即弃，直接原地改写，不再逐条 dict() 复制
+        for r in iter_records(entities_raw_path):
+            new_entities = []
+            for e in r.get("entities", []) or []:
+                if e.get("type") == "Person":
+                    name = (e.get("name") or "").strip()
+                    if not name or _is_generic_person(name):
+                        continue
+                    e["name"] = canon_name(name)
+                new_entities.append(e)
+            r["entities"] = new_entities
+            yield r
 
     out_dir.mkdir(parents=True, exist_ok=True)
+    write_jsonl(out_dir / "entities_clean.jsonl", clean_rows())
     write_json(out_dir / "alias_map.json", alias_map)
     write_json(out_dir / "entities_canon.json", canon_store)
-    write_jsonl(out_dir / "entities_clean.jsonl", clean_rows)
 
     print(f"[normalize_entities] input={entities_raw_path.resolve()}")
     print(f"[normalize_entities] out_dir={out_dir.resolve()}")
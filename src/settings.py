@@ -1,6 +1,8 @@
 from __future__ import annotations
 
+from functools import lru_cache
 from pathlib import Path
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
@@ -11,12 +13,17 @@ class Settings(BaseSettings):
 
     SQLITE_PATH: str = "data/app.db"
     SQLITE_ECHO: bool = False
+    DB_POOL_SIZE: int = 25
+    DB_MAX_OVERFLOW: int = 25
+    DB_POOL_RECYCLE_S: int = 1800
 
     # JWT
     JWT_SECRET_KEY: str = "change_me"
     JWT_ALG: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 20
     REFRESH_TOKEN_EXPIRE_DAYS: int = 14
+    REVOKED_BLOOM_CAPACITY: int = 100_000
+    REVOKED_BLOOM_ERROR_RATE: float = 1e-6
 
     # Cookies
     ACCESS_COOKIE_NAME: str = "access_token"
@@ -41,20 +48,31 @@ class Settings(BaseSettings):
     TIMEOUT_S: int = 60
     MAX_RETRIES: int = 5
     RETRY_BACKOFF_S: float = 1.5
+    # 离线抽取脚本的响应磁盘缓存目录；为空则不缓存
+    LLM_CACHE_DIR: str = ""
+    # 同时在途的 LLM 请求上限（普通 + 流式），超出的调用排队等待
+    LLM_MAX_CONCURRENCY: int = 32
+    # 问句实体抽取微批：窗口内的并发请求合并成一次调用
+    ENTITY_BATCH_WINDOW_S: float = 0.05
+    ENTITY_BATCH_MAX: int = 8
 
     # Neo4j
     NEO4J_URI: str = "neo4j://localhost:7687"
     NEO4J_USER: str = "neo4j"
     NEO4J_PASSWORD: str = "password"
     NEO4J_DATABASE: str = "neo4j"
+    NEO4J_MAX_POOL_SIZE: int = 100
+    NEO4J_ACQUISITION_TIMEOUT_S: float = 30
+    NEO4J_MAX_CONN_LIFETIME_S: float = 1800
+    NEO4J_LIVENESS_CHECK_S: float = 60  # 空闲超过该时长的连接，借出前先做一次存活探测
 
     model_config = SettingsConfigDict(
         env_file=str(PROJECT_ROOT / ".env"),
         env_file_encoding="utf-8",
         extra="ignore",
+        # 进程内只读：运行期不允许改配置
+        frozen=True,
     )
-    
-
 
     # Graph API limits
     GRAPH_MAX_DEPTH: int = 3
@@ -62,4 +80,10 @@ class Settings(BaseSettings):
     GRAPH_MAX_SNIPPET_LEN: int = 300
 
 
-settings = Settings()
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    # 整个进程只读一次 .env 并校验一次
+    return Settings()
+
+
+settings = get_settings()
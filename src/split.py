@@ -25,8 +25,9 @@ from __future__ import annotations
 import argparse
 import json
 import re
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
 
 
 # ----------------------------
@@ -36,10 +37,12 @@ _DIGIT = {"零": 0, "一": 1, "二": 2, "三": 3, "四": 4, "五": 5, "六": 6,
 _UNIT = {"十": 10, "百": 100, "千": 1000}
 
 
+@lru_cache(maxsize=4096)
 def cn2int(cn: str) -> int:
     """
     Convert common Chinese numerals up to 9999 into int.
     Handles: 零 一 二 三 四 五 六 七 八 九 十 百 千 两
+    Cached: headings reuse the same few numerals ("一", "十二", ...).
     """
     cn = cn.strip()
     if not cn:
@@ -112,6 +115,10 @@ def parse_chapters(book_text: str) -> List[Dict[str, Any]]:
 # ----------------------------
 # Chunking helpers
 # ----------------------------
+# Punctuation fallback, in priority order: the last "。" wins over a later "！", etc.
+_BREAK_PUNCT = ("。", "！", "？", "；", "…", "”", "）")
+
+
 def _find_breakpoint(text: str, start: int, hard_end: int, min_ratio: float = 0.7) -> int:
     """
     Move chunk end backward to a nicer boundary (blank line/newline/punctuation).
@@ -134,7 +141,7 @@ def _find_breakpoint(text: str, start: int, hard_end: int, min_ratio: float = 0.
         return window_start + idx + 1
 
     # then punctuation boundary
-    for p in ["。", "！", "？", "；", "…", "”", "）"]:
+    for p in _BREAK_PUNCT:
         idx = window.rfind(p)
         if idx != -1:
             return window_start + idx + 1
@@ -198,11 +205,38 @@ def chunk_text(text: str, chunk_size: int = 1200, overlap: int = 200) -> List[Tu
 # ----------------------------
 # IO
 # ----------------------------
-def write_jsonl(path: Path, rows: List[Dict[str, Any]]) -> None:
+def write_jsonl(path: Path, rows: Iterable[Dict[str, Any]]) -> int:
+    """
+    Stream rows to JSONL; returns the number of rows written.
+    """
     path.parent.mkdir(parents=True, exist_ok=True)
+    n = 0
     with path.open("w", encoding="utf-8") as f:
         for r in rows:
             f.write(json.dumps(r, ensure_ascii=False) + "\n")
+            n += 1
+    return n
+
+
+def iter_chunk_rows(
+    chapters: List[Dict[str, Any]], book_title: str, chunk_size: int, overlap: int
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield chunk records chapter by chapter, so only one chunk row is alive at a time.
+    """
+    for ch in chapters:
+        spans = chunk_text(ch["text"], chunk_size=chunk_size, overlap=overlap)
+        for idx, (s, e) in enumerate(spans):
+            yield {
+                "book_title": book_title,
+                "chapter_id": ch["chapter_id"],
+                "chapter_title": ch["chapter_title"],
+                "chunk_id": f"{ch['chapter_id']}_{idx:04d}",
+                "chunk_index": idx,
+                "start_char": s,
+                "end_char": e,
+                "text": ch["text"][s:e].strip(),
+            }
 
 
 # ----------------------------
@@ -237,25 +271,12 @@ def main() -> None:
     write_jsonl(out_dir / "chapters.jsonl", chapters_meta)
 
     # chunks.jsonl
-    chunk_rows: List[Dict[str, Any]] = []
-    for ch in chapters:
-        spans = chunk_text(ch["text"], chunk_size=args.chunk_size, overlap=args.overlap)
-        for idx, (s, e) in enumerate(spans):
-            chunk_rows.append(
-                {
-                    "book_title": args.book_title,
-                    "chapter_id": ch["chapter_id"],
-                    "chapter_title": ch["chapter_title"],
-                    "chunk_id": f"{ch['chapter_id']}_{idx:04d}",
-                    "chunk_index": idx,
-                    "start_char": s,
-                    "end_char": e,
-                    "text": ch["text"][s:e].strip(),
-                }
-            )
-    write_jsonl(out_dir / "chunks.jsonl", chunk_rows)
-
-    print(f"[OK] chapters={len(chapters_meta)} chunks={len(chunk_rows)} out_dir={out_dir.resolve()}")
+    n_chunks = write_jsonl(
+        out_dir / "chunks.jsonl",
+        iter_chunk_rows(chapters, args.book_title, args.chunk_size, args.overlap),
+    )
+
+    print(f"[OK] chapters={len(chapters_meta)} chunks={n_chunks} out_dir={out_dir.resolve()}")
 
 def run(
     input_path: str,
@@ -279,25 +300,12 @@ def run(
     ]
     write_jsonl(out_dir_path / "chapters.jsonl", chapters_meta)
 
-    chunk_rows: List[Dict[str, Any]] = []
-    for ch in chapters:
-        spans = chunk_text(ch["text"], chunk_size=chunk_size, overlap=overlap)
-        for idx, (s, e) in enumerate(spans):
-            chunk_rows.append(
-                {
-                    "book_title": book_title,
-                    "chapter_id": ch["chapter_id"],
-                    "chapter_title": ch["chapter_title"],
-                    "chunk_id": f"{ch['chapter_id']}_{idx:04d}",
-                    "chunk_index": idx,
-                    "start_char": s,
-                    "end_char": e,
-                    "text": ch["text"][s:e].strip(),
-                }
-            )
-    write_jsonl(out_dir_path / "chunks.jsonl", chunk_rows)
-
-    print(f"[OK] chapters={len(chapters_meta)} chunks={len(chunk_rows)} out_dir={out_dir_path.resolve()}")
+    n_chunks = write_jsonl(
+        out_dir_path / "chunks.jsonl",
+        iter_chunk_rows(chapters, book_title, chunk_size, overlap),
+    )
+
+    print(f"[OK] chapters={len(chapters_meta)} chunks={n_chunks} out_dir={out_dir_path.resolve()}")
 
 if __name__ == "__main__":
     ROOT = Path(__file__).resolve().parents[1]
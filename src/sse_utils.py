@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+from typing import Any, AsyncIterator
+
+import orjson
+from fastapi.responses import StreamingResponse
+
+# 事件名预先编码成 bytes
+EV_META = b"meta"
+EV_TOKEN = b"token"
+EV_DONE = b"done"
+EV_ERROR = b"error"
+
+_TOKEN_HEAD = b'event: token\ndata: {"id":'
+
+# 注释行：客户端忽略，只用来让代理/负载均衡保持连接
+_PING = b": ping\n\n"
+
+# no-cache + 关闭 nginx 缓冲，否则 token 会被攒成大块再下发
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def sse(event: bytes, data: Any) -> bytes:
+    """
+    组装一条 SSE 事件；orjson 会转义换行，data 一定只占一行。
+    """
+    return b"event: " + event + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+
+def sse_token(req_id: str, delta: str) -> bytes:
+    """
+    token 事件的快路径：结构固定，只对 id/delta 做 JSON 转义，不构造 dict。
+    输出与 sse(EV_TOKEN, {"id": req_id, "delta": delta}) 相同。
+    """
+    return _TOKEN_HEAD + orjson.dumps(req_id) + b',"delta":' + orjson.dumps(delta) + b"}\n\n"
+
+
+async def _with_keepalive(gen: AsyncIterator[bytes], interval: float) -> AsyncIterator[bytes]:
+    """
+    上游 interval 秒内没有产出就插一条 ping。
+    取下一条用独立 task + asyncio.wait 超时，不会因超时取消上游生成器。
+    """
+    nxt = asyncio.ensure_future(gen.__anext__())
+    try:
+        while True:
+            done, _ = await asyncio.wait({nxt}, timeout=interval)
+            if not done:
+                yield _PING
+                continue
+            try:
+                chunk = nxt.result()
+            except StopAsyncIteration:
+                return
+            yield chunk
+            nxt = asyncio.ensure_future(gen.__anext__())
+    finally:
+        if not nxt.done():
+            nxt.cancel()
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                await nxt
+        await gen.aclose()
+
+
+def event_stream_response(gen: AsyncIterator[bytes], ping: float = 15.0) -> StreamingResponse:
+    return StreamingResponse(
+        _with_keepalive(gen, ping),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )